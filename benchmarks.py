@@ -0,0 +1,331 @@
+import os
+import sys
+import json
+import argparse
+import glob
+import time
+import random
+import platform
+import tempfile
+import statistics
+
+import numpy as np
+import pygame
+import videogame as vg
+
+# Usage:
+#   python benchmarks.py [--scale N] [--repeat N] [--only a,b] [--output results.json]
+#   python benchmarks.py --compare baseline.json [--threshold 0.25]
+#   python benchmarks.py --replay session.rec  (replay benchmark on a recorded game)
+#
+# Every benchmark is seeded, so the same run always does the same work. --scale
+# multiplies the entity counts (projectiles, ships). Results are medians in ms.
+
+BENCHMARKS = {}
+
+def benchmark(name, repeat=30):
+    def register(fn):
+        BENCHMARKS[name] = (fn, repeat)
+        return fn
+    return register
+
+def timed(fn, repeat, setup=None):
+    # Median and min wall time of fn() in milliseconds; setup() runs untimed
+    # before every sample and its result is passed to fn
+    samples = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        fn(arg) if setup else fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": statistics.median(samples), "min_ms": min(samples), "samples": repeat}
+
+def asset_path(path):
+    return os.path.join(vg.base_path, path)
+
+PLAYER_SHEET = (asset_path("characters/player/player.json"), asset_path("characters/player/player.png"))
+
+
+# -----------------------------------------------------------------------------------
+# ASSET LOADING
+# -----------------------------------------------------------------------------------
+@benchmark("extract_frames_rgba")
+def bench_extract_frames_rgba(scale, repeat):
+    return timed(lambda: vg.extract_frames_rgba(*PLAYER_SHEET), repeat)
+
+@benchmark("extract_frames_as_ascii")
+def bench_extract_frames_as_ascii(scale, repeat):
+    return timed(lambda: vg.extract_frames_as_ascii(*PLAYER_SHEET), repeat)
+
+@benchmark("make_frame_rgba")
+def bench_make_frame_rgba(scale, repeat):
+    frames = list(vg.extract_frames_rgba(*PLAYER_SHEET).values())
+    return timed(lambda: [vg.make_frame_rgba(f) for f in frames], repeat)
+
+@benchmark("load_sprite_sheet")
+def bench_load_sprite_sheet(scale, repeat):
+    vg.load_sprite_sheet(*PLAYER_SHEET)  # make sure the cache is warm
+    return timed(lambda: vg.load_sprite_sheet(*PLAYER_SHEET), repeat)
+
+@benchmark("sound_decode", repeat=3)
+def bench_sound_decode(scale, repeat):
+    # Every effect (the songs are streamed, not decoded)
+    if not pygame.mixer.get_init():
+        pygame.mixer.init()
+    songs = {path for path, _ in vg.music.tracks.values()}
+    paths = [p for p in sorted(glob.glob(asset_path("sounds/*.mp3"))) if p not in songs]
+    return timed(lambda: [pygame.mixer.Sound(p) for p in paths], repeat)
+
+@benchmark("sound_decode_cached", repeat=3)
+def bench_sound_decode_cached(scale, repeat):
+    # The same effects through the transcoded audio cache, to compare with
+    # "sound_decode". The cache is built in a temporary directory so that the
+    # game's own cache is left alone
+    if not pygame.mixer.get_init():
+        pygame.mixer.init()
+    songs = {path for path, _ in vg.music.tracks.values()}
+    paths = [p for p in sorted(glob.glob(asset_path("sounds/*.mp3"))) if p not in songs]
+    cache_dir = vg.AUDIO_CACHE_DIR
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vg.AUDIO_CACHE_DIR = tmp_dir
+        try:
+            vg.build_audio_cache()
+            return timed(lambda: [vg.load_effect(p) for p in paths], repeat)
+        finally:
+            vg.AUDIO_CACHE_DIR = cache_dir
+
+
+# -----------------------------------------------------------------------------------
+# GAME LOGIC
+# -----------------------------------------------------------------------------------
+def boss_fight_state(projectiles, ships, seed=0):
+    # A boss fight in progress with a crowd of lasers and ships all over the world
+    rng = random.Random(seed)
+    state = vg.GameState(seed)
+    actors = state.actors
+    actors.active[vg.BOSS] = True
+    actors.phase[vg.BOSS] = vg.BOSS_COUNTDOWN
+    actors.x[vg.BOSS] = actors.prev_x[vg.BOSS] = vg.WORLD_WIDTH - 300
+    actors.x[vg.PLAYER] = actors.prev_x[vg.PLAYER] = vg.WORLD_WIDTH - 500
+    state.camera_x = state.prev_camera_x = vg.WORLD_WIDTH - vg.WIDTH
+    for i in range(projectiles):
+        state.projectiles.spawn(rng.uniform(0, vg.WORLD_WIDTH), rng.uniform(0, vg.HEIGHT),
+                                rng.uniform(-4, 4), rng.uniform(-4, 4), i % 3)
+    for _ in range(ships):
+        state.ships.spawn(x=rng.uniform(0, vg.WORLD_WIDTH), y=rng.uniform(10, 100))
+    return state
+
+@benchmark("mask_get_bounding_rect", repeat=100)
+def bench_mask_get_bounding_rect(scale, repeat):
+    masks = [info.mask for infos in vg.PLAYER_FRAME_INFO.values() for info in infos]
+    return timed(lambda: [vg.mask_get_bounding_rect(m) for m in masks], repeat)
+
+@benchmark("projectile_update", repeat=100)
+def bench_projectile_update(scale, repeat):
+    count = 1000 * scale
+    def setup():
+        return boss_fight_state(count, 0).projectiles
+    return timed(lambda pool: pool.update(-100, vg.WORLD_WIDTH + 100, -50, vg.HEIGHT + 50),
+                 repeat, setup)
+
+@benchmark("fleet_update", repeat=100)
+def bench_fleet_update(scale, repeat):
+    # One tick of 500 ships spawning, moving, culling and rolling their fire
+    count = 500 * scale
+    waves = [vg.Wave(interval=1, ships=5, fire_chance=0.01)]
+    def setup():
+        rng = np.random.default_rng(0)
+        fleet = vg.Fleet(rng)
+        fleet.start(waves, 0)
+        fleet.ships.spawn_many(count, x=rng.uniform(0, vg.WORLD_WIDTH, count),
+                               y=rng.uniform(10, 100, count), vx=-1, fire_chance=0.01)
+        return fleet, vg.ProjectilePool()
+    return timed(lambda arg: arg[0].update(500.0, True, arg[1]), repeat, setup)
+
+@benchmark("collisions", repeat=100)
+def bench_collisions(scale, repeat):
+    # Both hit checks (a vectorized rect test over every laser, then the exact
+    # tests on the few near the player or boss), without applying the hits
+    state = boss_fight_state(1000 * scale, 0)
+    def run():
+        state.actors.invincible[vg.PLAYER] = True
+        state.actors.invincible[vg.BOSS] = False
+        kill = state.projectiles.kill
+        state.projectiles.kill = lambda i: None
+        state.check_player_hits()
+        state.check_boss_hits()
+        state.projectiles.kill = kill
+        state.actors.hp[vg.BOSS] = 10
+    return timed(run, repeat)
+
+def legacy_lasers(state):
+    # The same lasers in the list layout main() used before the projectile pool
+    pool = state.projectiles
+    enemy_lasers, lasers = [], []
+    for i in range(pool.count):
+        x, y = float(pool.x[i]), float(pool.y[i])
+        if pool.owner[i] == vg.OWNER_BOSS:
+            enemy_lasers.append([x, y, float(pool.vx[i]), float(pool.vy[i]), "boss"])
+        elif pool.owner[i] == vg.OWNER_SHIP:
+            enemy_lasers.append([x, y, 3, "ship"])
+        else:
+            lasers.append([x, y, 1, "player"])
+    return enemy_lasers, lasers
+
+@benchmark("collisions_legacy", repeat=100)
+def bench_collisions_legacy(scale, repeat):
+    # The linear loops from before the projectile pool (a fresh Rect per laser),
+    # on the same lasers as "collisions", for comparison
+    state = boss_fight_state(1000 * scale, 0)
+    enemy_lasers, lasers = legacy_lasers(state)
+    actors = state.actors
+    player_x, player_y = actors.x[vg.PLAYER], actors.y[vg.PLAYER]
+    boss_x, boss_y = actors.x[vg.BOSS], actors.y[vg.BOSS]
+    frame_img, frame_mask = actors.frame[vg.PLAYER].image, actors.frame[vg.PLAYER].mask
+    boss_img = actors.frame[vg.BOSS].image
+    def run():
+        player_rect = frame_img.get_rect(topleft=(player_x, player_y))
+        for el in enemy_lasers:
+            el_rect = None
+            if len(el) == 5 and el[4] == "boss":
+                el_rect = vg.BOSS_LASER_IMG.get_rect(topleft=(el[0], el[1]))
+            elif len(el) == 4 and el[3] == "ship":
+                el_rect = pygame.Rect(el[0], el[1], 2*vg.SCALE_FACTOR, 2*vg.SCALE_FACTOR)
+            if el_rect and player_rect.colliderect(el_rect):
+                if len(el) == 5 and el[4] == "boss":
+                    offset_x = el_rect.x - player_rect.x
+                    offset_y = el_rect.y - player_rect.y
+                    frame_mask.overlap(vg.BOSS_LASER_MASK, (offset_x, offset_y))
+
+        boss_rect = boss_img.get_rect(topleft=(boss_x, boss_y))
+        for l in lasers:
+            if l[3] == "player":
+                l_rect = vg.PLAYER_LASER_IMG.get_rect(topleft=(l[0], l[1]))
+                l_rect.colliderect(boss_rect)
+    return timed(run, repeat)
+
+@benchmark("game_tick", repeat=5)
+def bench_game_tick(scale, repeat):
+    # 1000 autopilot ticks of a normal game from the start
+    def setup():
+        return vg.GameState(0), random.Random(0)
+    def run(arg):
+        state, rng = arg
+        for _ in range(1000):
+            state.step(vg.autopilot_inputs(state, rng))
+    return timed(run, repeat, setup)
+
+REPLAY_PATH = None
+
+@benchmark("replay", repeat=3)
+def bench_replay(scale, repeat):
+    # A recorded session (--replay PATH), or else a recorded autopilot game
+    if REPLAY_PATH:
+        recording = vg.InputRecording.load(REPLAY_PATH)
+    else:
+        recording = vg.InputRecording(0)
+        vg.run_headless(20000, seed=0, recording=recording)
+    return timed(lambda: vg.replay_headless(recording), repeat)
+
+
+# -----------------------------------------------------------------------------------
+# RENDERING
+# -----------------------------------------------------------------------------------
+@benchmark("draw_world", repeat=50)
+def bench_draw_world(scale, repeat):
+    state = boss_fight_state(1000 * scale, 20 * scale)
+    font = pygame.font.Font(None, 64)
+    world = vg.RENDER.world
+    return timed(lambda: vg.draw_world(world, state, font, 0.5), repeat)
+
+@benchmark("present", repeat=50)
+def bench_present(scale, repeat):
+    return timed(vg.RENDER.present, repeat)
+
+
+# -----------------------------------------------------------------------------------
+# RUN / COMPARE
+# -----------------------------------------------------------------------------------
+def run_benchmarks(names, scale=1, repeat=None):
+    results = {}
+    for name in names:
+        fn, default_repeat = BENCHMARKS[name]
+        np.random.seed(0)
+        random.seed(0)
+        results[name] = fn(scale, repeat or default_repeat)
+        print("%-26s %10.3f ms" % (name, results[name]["median_ms"]))
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "present_backend": vg.RENDER.name,
+            "scale": scale,
+        },
+        "results": results,
+    }
+
+def compare(current, baseline, threshold):
+    # Returns the names of benchmarks whose median got slower than baseline * (1 + threshold)
+    regressions = []
+    print("\n%-26s %12s %12s %8s" % ("benchmark", "baseline ms", "current ms", "change"))
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["median_ms"]
+        after = result["median_ms"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print("%-26s %12.3f %12.3f %+7.0f%%%s" % (name, before, after, change * 100, flag))
+    return regressions
+
+def benchmark_names(text):
+    # --only: comma-separated names, each one of BENCHMARKS
+    names = text.split(",")
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise argparse.ArgumentTypeError("unknown benchmark(s): %s (choose from %s)"
+                                         % (", ".join(unknown), ", ".join(BENCHMARKS)))
+    return names
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hypers on Mars benchmarks")
+    parser.add_argument("--scale", type=int, help="multiply the entity counts (default: 1, or the baseline's)")
+    parser.add_argument("--repeat", type=int, help="samples per benchmark (default: each benchmark's own)")
+    parser.add_argument("--only", type=benchmark_names, metavar="A,B", help="run only these benchmarks")
+    parser.add_argument("--output", metavar="PATH", help="write the results as JSON")
+    parser.add_argument("--compare", metavar="PATH", help="compare with a baseline written by --output")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="slowdown that counts as a regression with --compare (default: 0.25)")
+    parser.add_argument("--replay", metavar="PATH", help="recording for the replay benchmark")
+    args = parser.parse_args()
+
+    # Load the game without a window or sound
+    vg.init(headless=True)
+    REPLAY_PATH = args.replay
+    names = args.only or list(BENCHMARKS)
+    scale = args.scale or 1
+    repeat = args.repeat
+    baseline_path = args.compare
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        # Same work as the baseline, unless told otherwise
+        scale = args.scale or baseline["meta"]["scale"]
+
+    current = run_benchmarks(names, scale, repeat)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if baseline_path:
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print("\n%d regression(s): %s" % (len(regressions), ", ".join(regressions)))
+            sys.exit(1)
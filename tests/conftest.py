@@ -0,0 +1,17 @@
+import os
+import sys
+
+# The game module lives at the top of the repository; no window or sound device
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def game():
+    # The game module with its assets loaded, headless
+    import videogame
+    videogame.init(headless=True)
+    return videogame
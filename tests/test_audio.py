@@ -0,0 +1,46 @@
+import random
+
+
+class MusicRecorder:
+    # Stands in for the MusicChannel: records what it is told to do
+    def __init__(self):
+        self.calls = []
+        self.current = None
+
+    def play(self, name, loops=-1):
+        self.calls.append(("play", name, loops))
+        self.current = name
+
+    def queue(self, name, loops=-1):
+        self.calls.append(("queue", name, loops))
+
+    def stop(self):
+        self.calls.append(("stop",))
+        self.current = None
+
+    def is_playing(self, name):
+        return self.current == name
+
+
+def boss_cues(vg):
+    # Every cue of an autopilot game up to the start of the boss fight
+    state = vg.GameState(0)
+    state.actors.hp[vg.PLAYER] = 1000
+    rng = random.Random(0)
+    cues = []
+    while state.actors.phase[vg.BOSS] != vg.BOSS_FIGHTING:
+        state.step(vg.autopilot_inputs(state, rng))
+        cues.extend(cue for cue in state.cues if cue[0].startswith("music"))
+    return cues
+
+def test_queued_track_plays_once(game, monkeypatch):
+    vg = game
+    music = MusicRecorder()
+    monkeypatch.setattr(vg, "music", music)
+    monkeypatch.setattr(vg.voices, "set_loop", lambda name, on: None)
+    vg.play_cues(boss_cues(vg), False)
+    assert music.calls == [
+        ("stop",), ("play", "spaceships", -1),
+        ("stop",), ("play", "boss_appears", 0), ("queue", "final_battle", -1),
+        ("play", "final_battle", -1),
+    ]
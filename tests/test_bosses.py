@@ -0,0 +1,23 @@
+def two_boss_level(vg):
+    return vg.Level(2000, [vg.LevelEvent(100.0, "boss", {}), vg.LevelEvent(100.0, "boss", {})])
+
+def test_every_boss_has_its_own_encounter(game):
+    vg = game
+    state = vg.GameState(0, level=two_boss_level(vg))
+    a = state.actors
+    bosses = (a.kind[:a.count] == vg.KIND_BOSS).nonzero()[0].tolist()
+    assert len(bosses) == 2
+    a.x[vg.PLAYER] = 150.0
+    while not all(a.phase[i] == vg.BOSS_FIGHTING for i in bosses):
+        state.step(vg.NO_INPUTS)
+    assert a.active[bosses].all()
+    assert a.countdown[bosses].tolist() == [4 * vg.FPS] * 2
+
+    # Defeating one boss leaves the game running until the other falls too
+    a.hp[bosses[0]] = 0
+    state.step(vg.NO_INPUTS)
+    assert state.running
+    a.hp[bosses[1]] = 0
+    state.step(vg.NO_INPUTS)
+    assert not state.running
+    assert vg.game_result(state) == "won"
@@ -0,0 +1,51 @@
+import random
+
+import pygame
+
+
+def crowded_state(vg, seed):
+    # Lasers of every owner packed around the player and the boss
+    rng = random.Random(seed)
+    state = vg.GameState(seed)
+    actors = state.actors
+    actors.active[vg.BOSS] = True
+    actors.x[vg.PLAYER], actors.y[vg.PLAYER] = 400.0, 150.0
+    actors.x[vg.BOSS], actors.y[vg.BOSS] = 520.0, 100.0
+    for i in range(300):
+        state.projectiles.spawn(rng.uniform(330, 650), rng.uniform(60, 260), 0, 0, i % 3)
+    return state
+
+def laser_rect(vg, pool, i):
+    # The rect main() built for each laser before the projectile pool
+    x, y = float(pool.x[i]), float(pool.y[i])
+    if pool.owner[i] == vg.OWNER_SHIP:
+        return pygame.Rect(x, y, 2*vg.SCALE_FACTOR, 2*vg.SCALE_FACTOR)
+    return vg.LASER_IMAGES[int(pool.owner[i])].get_rect(topleft=(x, y))
+
+def test_candidates_cover_every_touching_laser(game):
+    vg = game
+    for seed in range(20):
+        state = crowded_state(vg, seed)
+        a = state.actors
+        pool = state.projectiles
+        for row in (vg.PLAYER, vg.BOSS):
+            rect = a.frame[row].image.get_rect(topleft=(a.x[row], a.y[row]))
+            touching = [i for i in range(pool.count) if laser_rect(vg, pool, i).colliderect(rect)]
+            candidates = state.projectile_candidates(rect).tolist()
+            assert touching
+            assert set(touching) <= set(candidates)
+            assert len(candidates) < pool.count
+
+def test_hits_match_the_per_laser_loop(game):
+    vg = game
+    for seed in range(20):
+        state = crowded_state(vg, seed)
+        a = state.actors
+        pool = state.projectiles
+        boss_rect = a.frame[vg.BOSS].image.get_rect(topleft=(a.x[vg.BOSS], a.y[vg.BOSS]))
+        first = next(i for i in range(pool.count) if pool.owner[i] == vg.OWNER_PLAYER and
+                     laser_rect(vg, pool, i).colliderect(boss_rect))
+        state.check_boss_hits()
+        assert a.hp[vg.BOSS] == 9
+        assert not pool.alive[first]
+        assert pool.alive[:pool.count].sum() == pool.count - 1
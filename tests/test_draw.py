@@ -0,0 +1,20 @@
+import pygame
+
+
+def draw(vg, state, alpha):
+    surf = pygame.Surface((vg.WIDTH, vg.HEIGHT))
+    vg.draw_world(surf, state, pygame.font.Font(None, 64), alpha)
+    return pygame.image.tostring(surf, "RGB")
+
+def test_ships_interpolate_at_their_own_speed(game, monkeypatch):
+    vg = game
+    monkeypatch.setattr(pygame.time, "get_ticks", lambda: 150)
+    for vx in (-1.0, -2.5, -4.0):
+        between = vg.GameState(0)
+        between.ships.count = 0
+        between.ships.spawn(x=300.0, y=50.0, vx=vx)
+        # Half a tick before the last one: half a tick of velocity back
+        exact = vg.GameState(0)
+        exact.ships.count = 0
+        exact.ships.spawn(x=300.0 - vx * 0.5, y=50.0, vx=vx)
+        assert draw(vg, between, 0.5) == draw(vg, exact, 1.0)
@@ -0,0 +1,56 @@
+import os
+import random
+
+import pytest
+
+
+def trace(vg, level, seed, ticks=3000):
+    # What the game did, tick by tick, under autopilot
+    state = vg.GameState(seed, level=level)
+    rng = random.Random(seed)
+    result = []
+    for _ in range(ticks):
+        state.step(vg.autopilot_inputs(state, rng))
+        a = state.actors
+        result.append((float(a.x[vg.PLAYER]), float(a.y[vg.PLAYER]), int(a.hp[vg.PLAYER]),
+                       int(a.hp[vg.BOSS]), float(state.camera_x), state.ships.count,
+                       state.projectiles.count, tuple(state.cues)))
+        if not state.running:
+            break
+    return result
+
+def test_compiled_level_round_trip(game, tmp_path):
+    vg = game
+    source = os.path.join(vg.base_path, "levels", "level1.json")
+    compiled = str(tmp_path / "level1.lvl")
+    vg.Level.load(source).compile(compiled)
+
+    json_level = vg.Level.load(source)
+    binary_level = vg.Level.load(compiled)
+    assert binary_level.width == json_level.width
+    assert isinstance(binary_level.width, int)
+    assert binary_level.events == json_level.events
+    assert binary_level.to_dict() == json_level.to_dict()
+
+    for seed in range(3):
+        assert trace(vg, binary_level, seed) == trace(vg, json_level, seed)
+
+def test_compiled_level_version_is_checked(game, tmp_path):
+    vg = game
+    compiled = tmp_path / "level1.lvl"
+    vg.Level.load(os.path.join(vg.base_path, "levels", "level1.json")).compile(str(compiled))
+    data = bytearray(compiled.read_bytes())
+    data[len(vg.LEVEL_MAGIC)] = vg.LEVEL_VERSION + 1
+    compiled.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        vg.Level.load(str(compiled))
+
+def test_event_cursor_fires_each_event_once(game):
+    vg = game
+    events = [vg.LevelEvent(float(x), "stop_spawning", {"n": i}) for i, x in enumerate([0, 5, 5, 10, 30])]
+    cursor = vg.EventCursor(vg.Level(100, events))
+    assert [e.args["n"] for e in cursor.advance(5)] == [0]
+    assert [e.args["n"] for e in cursor.advance(5.5)] == [1, 2]
+    assert list(cursor.advance(4)) == []
+    assert [e.args["n"] for e in cursor.advance(100)] == [3, 4]
+    assert list(cursor.advance(200)) == []
@@ -0,0 +1,49 @@
+import pytest
+
+
+def final_state(vg, recording):
+    state = vg.GameState(recording.seed)
+    for inputs in recording:
+        state.step(inputs)
+    return state
+
+def actor_state(vg, state):
+    a = state.actors
+    columns = {name: getattr(a, name)[:a.count].tolist()
+               for name, dtype in vg.ACTOR_COLUMNS.items() if dtype is not object}
+    return columns, state.player_state, float(state.camera_x), state.tick, state.running
+
+def test_saved_game_replays_exactly(game, tmp_path):
+    vg = game
+    played = []
+    def autopilot(state, rng):
+        played[:] = [state]
+        return vg.autopilot_inputs(state, rng)
+
+    recording = vg.InputRecording(0)
+    stats = vg.run_headless(20000, autopilot, seed=3, recording=recording)
+    assert stats["results"] in (["won"], ["lost"])
+    path = str(tmp_path / "game.rec")
+    recording.save(path)
+
+    loaded = vg.InputRecording.load(path)
+    assert loaded.seed == 3
+    assert len(loaded) == stats["ticks"]
+    replay = vg.replay_headless(loaded)
+    assert replay["ticks"] == stats["ticks"]
+    assert replay["results"] == stats["results"]
+    assert actor_state(vg, final_state(vg, loaded)) == actor_state(vg, played[0])
+
+def test_bad_recordings_are_refused(game, tmp_path):
+    vg = game
+    recording = vg.InputRecording(7)
+    vg.run_headless(500, seed=7, recording=recording)
+    path = tmp_path / "game.rec"
+    recording.save(str(path))
+    data = path.read_bytes()
+
+    old_version = data[:4] + bytes([vg.RECORDING_VERSION - 1]) + data[5:]
+    for damaged in (old_version, b"NOPE" + data[4:], data[:-5], data[:10], b""):
+        path.write_bytes(damaged)
+        with pytest.raises(ValueError):
+            vg.InputRecording.load(str(path))
@@ -0,0 +1,203 @@
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+import pygame
+import pytest
+from PIL import Image
+
+import videogame as vg
+
+# The sprite helpers must give exactly what the original per-pixel versions
+# gave. These are those versions, as they were before the NumPy rewrite.
+
+def legacy_extract_frames_as_ascii(json_path, image_path):
+    color_mapping = {
+        (0,   0,   0, 255): "X",
+        (255, 255, 255, 255): ".",
+        (255,   0,   0, 255): "R",
+        (  0, 255,   0, 255): "G",
+        (  0,   0, 255, 255): "B",
+    }
+    transparent_char = " "
+    default_char = "X"
+
+    with open(json_path, 'r') as f:
+        data = json.load(f)
+    img = Image.open(image_path).convert("RGBA")
+    result = {}
+    for frame_name, frame_info in data["frames"].items():
+        x, y = frame_info["frame"]["x"], frame_info["frame"]["y"]
+        w, h = frame_info["frame"]["w"], frame_info["frame"]["h"]
+        pixels = img.crop((x, y, x + w, y + h)).load()
+        ascii_rows = []
+        for row in range(h):
+            row_chars = []
+            for col in range(w):
+                r, g, b, a = pixels[col, row]
+                if a == 0:
+                    row_chars.append(transparent_char)
+                else:
+                    row_chars.append(color_mapping.get((r, g, b, a), default_char))
+            ascii_rows.append("".join(row_chars))
+        result[frame_name] = ascii_rows
+    return result
+
+def legacy_extract_frames_rgba(json_path, image_path):
+    with open(json_path, 'r') as f:
+        data = json.load(f)
+    img = Image.open(image_path).convert("RGBA")
+    result = {}
+    for frame_name, frame_info in data["frames"].items():
+        x, y = frame_info["frame"]["x"], frame_info["frame"]["y"]
+        w, h = frame_info["frame"]["w"], frame_info["frame"]["h"]
+        pixels = img.crop((x, y, x + w, y + h)).load()
+        result[frame_name] = [[pixels[col, row] for col in range(w)] for row in range(h)]
+    return result
+
+def legacy_make_frame_rgba(rgba_rows):
+    height = len(rgba_rows)
+    width = len(rgba_rows[0]) if height > 0 else 0
+    surf = pygame.Surface((width, height), pygame.SRCALPHA)
+    for y in range(height):
+        for x in range(width):
+            surf.set_at((x, y), rgba_rows[y][x])
+    return surf
+
+def legacy_mask_get_bounding_rect(mask):
+    w, h = mask.get_size()
+    min_x, min_y = w, h
+    max_x, max_y = -1, -1
+    for y in range(h):
+        for x in range(w):
+            if mask.get_at((x, y)) != 0:
+                min_x, max_x = min(min_x, x), max(max_x, x)
+                min_y, max_y = min(min_y, y), max(max_y, y)
+    if max_x < min_x or max_y < min_y:
+        return pygame.Rect(0, 0, 0, 0)
+    return pygame.Rect(min_x, min_y, max_x - min_x + 1, max_y - min_y + 1)
+
+
+def sheet(*parts):
+    return (os.path.join(vg.base_path, "characters", *parts) + ".json",
+            os.path.join(vg.base_path, "characters", *parts) + ".png")
+
+@pytest.fixture(scope="module")
+def odd_atlas(tmp_path_factory):
+    # Random pixels plus the exact colors of the ASCII palette, and frames that
+    # hang off every edge of the atlas or miss it entirely
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 256, (40, 60, 4), dtype=np.uint8)
+    pixels[rng.random((40, 60)) < 0.3, 3] = 0
+    palette = np.array([(0, 0, 0, 255), (255, 255, 255, 255), (255, 0, 0, 255),
+                        (0, 255, 0, 255), (0, 0, 255, 255), (9, 9, 9, 0)], dtype=np.uint8)
+    pixels[rng.random((40, 60)) < 0.4] = palette[rng.integers(0, len(palette), 1)]
+    pixels[::3, ::2] = palette[rng.integers(0, len(palette), pixels[::3, ::2].shape[:2])]
+
+    directory = tmp_path_factory.mktemp("atlas")
+    image_path = directory / "odd.png"
+    Image.fromarray(pixels, "RGBA").save(image_path)
+    frames = {
+        "inside": (5, 4, 20, 10),
+        "right_edge": (50, 10, 20, 8),
+        "bottom_edge": (10, 35, 12, 12),
+        "top_left": (-5, -3, 10, 9),
+        "outside": (70, 50, 6, 4),
+        "whole": (0, 0, 60, 40),
+    }
+    json_path = directory / "odd.json"
+    json_path.write_text(json.dumps({"frames": {
+        name: {"frame": {"x": x, "y": y, "w": w, "h": h}} for name, (x, y, w, h) in frames.items()}}))
+    return str(json_path), str(image_path)
+
+@pytest.fixture(params=["player", "enemy", "odd"])
+def atlas(request, odd_atlas):
+    if request.param == "odd":
+        return odd_atlas
+    return sheet(request.param, request.param)
+
+
+def test_extract_frames_as_ascii(atlas):
+    assert vg.extract_frames_as_ascii(*atlas) == legacy_extract_frames_as_ascii(*atlas)
+
+def test_extract_frames_rgba(atlas):
+    new = vg.extract_frames_rgba(*atlas)
+    old = legacy_extract_frames_rgba(*atlas)
+    assert new.keys() == old.keys()
+    for name, rows in old.items():
+        assert new[name].tolist() == [[list(pixel) for pixel in row] for row in rows]
+
+def test_make_frame_rgba(atlas):
+    new = vg.extract_frames_rgba(*atlas)
+    for name, rows in legacy_extract_frames_rgba(*atlas).items():
+        expected = legacy_make_frame_rgba(rows)
+        for surf in (vg.make_frame_rgba(new[name]), vg.make_frame_rgba(rows)):
+            assert surf.get_size() == expected.get_size()
+            assert pygame.image.tostring(surf, "RGBA") == pygame.image.tostring(expected, "RGBA")
+
+def test_mask_get_bounding_rect(atlas):
+    for rows in legacy_extract_frames_rgba(*atlas).values():
+        surf = legacy_make_frame_rgba(rows)
+        for mask in (pygame.mask.from_surface(surf),
+                     pygame.mask.from_surface(pygame.transform.flip(surf, True, False))):
+            assert vg.mask_get_bounding_rect(mask) == legacy_mask_get_bounding_rect(mask)
+
+def test_mask_get_bounding_rect_scattered():
+    # Several separate blobs, and an empty mask
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        mask = pygame.mask.Mask((30, 20))
+        for x, y in rng.integers(0, (30, 20), (rng.integers(0, 6), 2)).tolist():
+            mask.set_at((x, y))
+        assert vg.mask_get_bounding_rect(mask) == legacy_mask_get_bounding_rect(mask)
+
+
+# The sprite cache: a bake is keyed on the asset contents, and a cache file
+# that can't be read is baked again.
+
+def test_cache_key_follows_the_assets(tmp_path):
+    json_path, image_path = str(tmp_path / "sheet.json"), str(tmp_path / "sheet.png")
+    for source, copy in zip(sheet("player", "player"), (json_path, image_path)):
+        shutil.copy(source, copy)
+    key = vg.sprite_cache_key(json_path, image_path)
+    assert vg.sprite_cache_key(json_path, image_path) == key
+
+    img = Image.open(image_path).convert("RGBA")
+    img.putpixel((0, 0), (1, 2, 3, 255) if img.getpixel((0, 0)) != (1, 2, 3, 255) else (0, 0, 0, 0))
+    img.save(image_path)
+    assert vg.sprite_cache_key(json_path, image_path) != key
+
+def frames_bytes(frames):
+    return {name: (pygame.image.tostring(frame.image, "RGBA"), frame.mask.count(), frame.ascii)
+            for name, frame in frames.items()}
+
+@pytest.mark.parametrize("damage", [b"not a pickle", b""])
+def test_corrupt_cache_is_baked_again(game, tmp_path, monkeypatch, damage):
+    monkeypatch.setattr(vg, "SPRITE_CACHE_DIR", str(tmp_path))
+    player = sheet("player", "player")
+    bakes = []
+    bake = vg.bake_sprite_sheet
+    monkeypatch.setattr(vg, "bake_sprite_sheet", lambda *paths: bakes.append(paths) or bake(*paths))
+
+    fresh = frames_bytes(vg.load_sprite_sheet(*player))
+    (cache_file,) = tmp_path.glob("player-*.pkl")
+    assert frames_bytes(vg.load_sprite_sheet(*player)) == fresh
+    assert len(bakes) == 1
+
+    cache_file.write_bytes(damage)
+    assert frames_bytes(vg.load_sprite_sheet(*player)) == fresh
+    assert len(bakes) == 2
+    # and the bake was written back
+    assert frames_bytes(vg.load_sprite_sheet(*player)) == fresh
+    assert len(bakes) == 2
+
+def test_bundled_build_caches_outside_its_temporary_folder(tmp_path, monkeypatch):
+    monkeypatch.delenv("HYPERS_CACHE_DIR", raising=False)
+    monkeypatch.setattr(sys, "_MEIPASS", str(tmp_path / "bundle"), raising=False)
+    monkeypatch.setattr(sys, "platform", "linux")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    assert vg.cache_root() == str(tmp_path / "cache" / "HypersOnMars")
+    monkeypatch.setenv("HYPERS_CACHE_DIR", str(tmp_path / "mine"))
+    assert vg.cache_root() == str(tmp_path / "mine")
@@ -0,0 +1,62 @@
+import pygame
+import pytest
+
+
+@pytest.fixture
+def manager(game, monkeypatch):
+    # A VoiceManager of its own over silent ten-second sounds, so every voice
+    # is still playing when the test looks at it
+    vg = game
+    if not pygame.mixer.get_init():
+        pygame.mixer.init()
+    frequency, size, channels = pygame.mixer.get_init()
+    silence = pygame.mixer.Sound(buffer=bytes(10 * frequency * channels * abs(size) // 8))
+    specs = {"shot": ("player", 2), "jump": ("player", 1), "boom": ("enemies", 3), "walk": ("loops", 1)}
+    monkeypatch.setattr(vg, "sounds", {name: silence for name in specs})
+    voices = vg.VoiceManager({"player": 3, "enemies": 2, "loops": 1}, specs)
+    voices.setup()
+    yield voices
+    pygame.mixer.stop()
+    vg.voices.setup()
+
+def test_groups_get_their_own_channels(manager):
+    assert manager.channels == {"player": [0, 1, 2], "enemies": [3, 4], "loops": [5]}
+    assert manager.play("boom").channel == 3
+    assert manager.play("shot").channel == 0
+
+def test_a_sound_over_its_cap_steals_its_own_oldest_voice(manager):
+    first = manager.play("shot")
+    second = manager.play("shot")
+    assert (first.channel, second.channel) == (0, 1)
+    third = manager.play("shot")
+    assert third.channel == first.channel
+    assert not manager.playing(first)
+    assert manager.playing(second) and manager.playing(third)
+    # The third player channel is still free for another sound
+    assert manager.play("jump").channel == 2
+
+def test_a_full_group_steals_its_oldest_voice(manager):
+    booms = [manager.play("boom") for _ in range(3)]
+    assert [v.channel for v in booms] == [3, 4, 3]
+    assert manager.play("boom").channel == 4
+    # The other groups are untouched
+    assert manager.play("shot").channel == 0
+
+def test_stopped_channels_are_reused_first(manager):
+    jump = manager.play("jump")
+    shot = manager.play("shot")
+    manager.stop(jump)
+    assert not manager.playing(jump)
+    assert manager.play("shot").channel == jump.channel
+    assert manager.playing(shot)
+
+def test_set_loop_twice_keeps_one_voice(manager):
+    manager.set_loop("walk", True)
+    voice = manager.loops["walk"]
+    manager.set_loop("walk", True)
+    assert manager.loops["walk"] is voice
+    assert manager.playing(voice)
+    manager.set_loop("walk", False)
+    assert not manager.playing(voice)
+    manager.set_loop("walk", False)
+    assert "walk" not in manager.loops
@@ -2,13 +2,29 @@ import pygame
 import sys
 import random
 import json
+import argparse
 import math
 from PIL import Image
+import numpy as np
 import os
 import time
-
-print("Initializing game, please wait...")
-time.sleep(2)  # Optional delay to ensure the message is visible
+import threading
+import collections
+import concurrent.futures
+import hashlib
+import pickle
+import csv
+import struct
+import zlib
+import bisect
+import mmap
+import wave
+
+# Importing this module does nothing but define things: no window, no sound and
+# no asset loading until init() (or main(), which calls it) runs. Tools can use
+# the helpers straight away; anything that needs assets has to call init() first.
+# "python videogame.py --headless [--ticks N]" only runs the game logic:
+# no window, no audio and no frame limiter (see run_headless).
 
 # Determine if running in a bundle (PyInstaller executable)
 if hasattr(sys, '_MEIPASS'):
@@ -17,97 +33,195 @@ else:
     base_path = os.path.abspath(".")
 
 
+FPS = 60
+WIDTH, HEIGHT = 640, 360
+SCALE_FACTOR = 2
+
+# -----------------------------------------------------------------------------------
+# RENDER CONTEXT
+# -----------------------------------------------------------------------------------
+# Every frame is drawn into a WIDTH x HEIGHT world buffer; a render context owns
+# that buffer and gets it onto the screen. Choose one with --present NAME or
+# HYPERS_PRESENT=NAME:
+#   scaled - SDL's SCALED display mode, the window is upscaled by SDL itself
+#   sdl2   - pygame._sdl2 Renderer, the buffer is uploaded to a texture that the
+#            renderer (hardware or software) stretches over the window
+#   blit   - transform.scale on the CPU into a SCALE_FACTOR-sized window
+PRESENT_BACKENDS = ("scaled", "sdl2", "blit")
+DEFAULT_PRESENT_BACKEND = "scaled"
+WINDOW_TITLE = "Cyberpunk Mars"
+
+class RenderContext:
+    # The "blit" backend. The buffers are created once in the display's pixel
+    # format and present() scales the world straight into the display surface,
+    # so no full-screen surface is allocated per frame.
+    name = "blit"
+
+    def __init__(self):
+        self.display = pygame.display.set_mode((WIDTH * SCALE_FACTOR, HEIGHT * SCALE_FACTOR))
+        pygame.display.set_caption(WINDOW_TITLE)
+        self.world = pygame.Surface((WIDTH, HEIGHT)).convert(self.display)
+
+    # present() is split in two so the profiler can time the halves separately:
+    # scale() gets the world buffer into the window, flip() shows it
+    def present(self):
+        self.scale()
+        self.flip()
+
+    def scale(self):
+        pygame.transform.scale(self.world, self.display.get_size(), self.display)
+
+    def flip(self):
+        pygame.display.flip()
+
+class ScaledRenderContext(RenderContext):
+    # The display surface itself is WIDTH x HEIGHT: draw into it and flip
+    name = "scaled"
+
+    def __init__(self):
+        self.display = pygame.display.set_mode((WIDTH, HEIGHT), pygame.SCALED)
+        pygame.display.set_caption(WINDOW_TITLE)
+        self.world = self.display
+
+    def scale(self):
+        pass  # SDL scales during flip()
+
+class Sdl2RenderContext(RenderContext):
+    # No pygame display surface here (so assets keep their own pixel format);
+    # the world buffer is streamed into one texture per frame
+    name = "sdl2"
+
+    def __init__(self):
+        from pygame._sdl2.video import Window, Renderer, Texture
+        self.window = Window(WINDOW_TITLE, size=(WIDTH * SCALE_FACTOR, HEIGHT * SCALE_FACTOR))
+        self.renderer = Renderer(self.window)
+        self.renderer.logical_size = (WIDTH, HEIGHT)
+        self.texture = Texture(self.renderer, (WIDTH, HEIGHT), streaming=True)
+        self.display = None
+        self.world = pygame.Surface((WIDTH, HEIGHT), 0, 32)
+
+    def scale(self):
+        self.texture.update(self.world)
+        self.renderer.clear()
+        self.texture.draw()
+
+    def flip(self):
+        self.renderer.present()
+
+RENDER_CONTEXTS = {
+    "scaled": ScaledRenderContext,
+    "sdl2": Sdl2RenderContext,
+    "blit": RenderContext,
+}
+
+def create_render_context(name):
+    # Falls back to the plain blit path if the requested backend isn't available
+    if name not in RENDER_CONTEXTS:
+        print("Unknown presentation backend %r, use one of: %s" % (name, ", ".join(PRESENT_BACKENDS)))
+        name = DEFAULT_PRESENT_BACKEND
+    try:
+        return RENDER_CONTEXTS[name]()
+    except (pygame.error, ImportError) as e:
+        if name == "blit":
+            raise
+        print("Presentation backend %r unavailable (%s), using blit" % (name, e))
+        return RenderContext()
+
 def show_loading_screen():
-    os.environ['SDL_VIDEO_CENTERED'] = '1'  # Center the Pygame window on the screen
-    pygame.init()
-    loading_display = pygame.display.set_mode((640, 360))  # Temporary loading screen
-    pygame.display.set_caption("Loading...")
     font = pygame.font.Font(None, 48)
     loading_text = font.render("Loading... Please wait", True, (255, 255, 255))
-    loading_display.fill((0, 0, 0))  # Black background
-    loading_display.blit(loading_text, (80, 160))  # Centered text
-    pygame.display.flip()
-
-# Show the loading screen
-pygame.init()
-show_loading_screen()
-
-def extract_frames_as_ascii(json_path, image_path):
-    color_mapping = {
-        (0,   0,   0, 255): "X",
-        (255, 255, 255, 255): ".",
-        (255,   0,   0, 255): "R",
-        (  0, 255,   0, 255): "G",
-        (  0,   0, 255, 255): "B",
-    }
-    transparent_char = " "
-    default_char = "X"
+    RENDER.world.fill((0, 0, 0))  # Black background
+    RENDER.world.blit(loading_text, (80, 160))  # Centered text
+    RENDER.present()
+
+# Set by init()
+RENDER = None
+DISPLAY = None
+
+ASCII_COLOR_MAPPING = {
+    (0,   0,   0, 255): "X",
+    (255, 255, 255, 255): ".",
+    (255,   0,   0, 255): "R",
+    (  0, 255,   0, 255): "G",
+    (  0,   0, 255, 255): "B",
+}
+ASCII_TRANSPARENT_CHAR = " "
+ASCII_DEFAULT_CHAR = "X"
 
+def load_atlas(json_path, image_path):
+    # The whole sheet is decoded once into an (h, w, 4) uint8 array
     with open(json_path, 'r') as f:
         data = json.load(f)
-    img = Image.open(image_path).convert("RGBA")
-    frames = data["frames"]
+    atlas = np.asarray(Image.open(image_path).convert("RGBA"), dtype=np.uint8)
+    return data["frames"], atlas
+
+def crop_atlas(atlas, frame_info):
+    x = frame_info["frame"]["x"]
+    y = frame_info["frame"]["y"]
+    w = frame_info["frame"]["w"]
+    h = frame_info["frame"]["h"]
+
+    # Same as PIL's crop: whatever falls outside the atlas is transparent black
+    atlas_h, atlas_w = atlas.shape[:2]
+    if x >= 0 and y >= 0 and x + w <= atlas_w and y + h <= atlas_h:
+        return atlas[y:y + h, x:x + w]
+    cropped = np.zeros((h, w) + atlas.shape[2:], dtype=atlas.dtype)
+    src_x0, src_y0 = max(x, 0), max(y, 0)
+    src_x1, src_y1 = min(x + w, atlas_w), min(y + h, atlas_h)
+    if src_x1 > src_x0 and src_y1 > src_y0:
+        cropped[src_y0 - y:src_y1 - y, src_x0 - x:src_x1 - x] = atlas[src_y0:src_y1, src_x0:src_x1]
+    return cropped
+
+def atlas_to_ascii(atlas):
+    # Palette lookup: every distinct RGBA value is mapped to a character once
+    packed = atlas.astype(np.uint32)
+    packed = (packed[..., 0] << 24) | (packed[..., 1] << 16) | (packed[..., 2] << 8) | packed[..., 3]
+    colors, inverse = np.unique(packed, return_inverse=True)
+    palette = np.empty(len(colors), dtype=np.uint8)
+    for i, c in enumerate(colors.tolist()):
+        rgba = (c >> 24 & 0xFF, c >> 16 & 0xFF, c >> 8 & 0xFF, c & 0xFF)
+        if rgba[3] == 0:
+            palette[i] = ord(ASCII_TRANSPARENT_CHAR)
+        else:
+            palette[i] = ord(ASCII_COLOR_MAPPING.get(rgba, ASCII_DEFAULT_CHAR))
+    return palette[inverse.reshape(packed.shape)]
+
+def extract_frames_as_ascii(json_path, image_path):
+    frames, atlas = load_atlas(json_path, image_path)
+    ascii_atlas = atlas_to_ascii(atlas)[..., np.newaxis]
     result = {}
 
     for frame_name, frame_info in frames.items():
-        x = frame_info["frame"]["x"]
-        y = frame_info["frame"]["y"]
-        w = frame_info["frame"]["w"]
-        h = frame_info["frame"]["h"]
-
-        cropped = img.crop((x, y, x + w, y + h))
-        pixels = cropped.load()
-
-        ascii_rows = []
-        for row in range(h):
-            row_chars = []
-            for col in range(w):
-                r, g, b, a = pixels[col, row]
-                if a == 0:
-                    row_chars.append(transparent_char)
-                else:
-                    row_chars.append(color_mapping.get((r, g, b, a), default_char))
-            ascii_rows.append("".join(row_chars))
-
-        result[frame_name] = ascii_rows
+        chars = crop_atlas(ascii_atlas, frame_info)[..., 0]
+        # Out-of-atlas padding comes back as zeros, which are transparent pixels
+        chars = np.where(chars == 0, ord(ASCII_TRANSPARENT_CHAR), chars).astype(np.uint8)
+        result[frame_name] = [row.tobytes().decode("ascii") for row in chars]
     return result
 
 def extract_frames_rgba(json_path, image_path):
-    with open(json_path, 'r') as f:
-        data = json.load(f)
-    img = Image.open(image_path).convert("RGBA")
-    frames = data["frames"]
+    # Each frame is an (h, w, 4) uint8 array: rows of (r, g, b, a) pixels
+    frames, atlas = load_atlas(json_path, image_path)
     result = {}
 
     for frame_name, frame_info in frames.items():
-        x = frame_info["frame"]["x"]
-        y = frame_info["frame"]["y"]
-        w = frame_info["frame"]["w"]
-        h = frame_info["frame"]["h"]
-
-        cropped = img.crop((x, y, x + w, y + h))
-        pixels = cropped.load()
-
-        rgba_rows = []
-        for row in range(h):
-            row_cols = []
-            for col in range(w):
-                r, g, b, a = pixels[col, row]
-                row_cols.append((r, g, b, a))
-            rgba_rows.append(row_cols)
-
-        result[frame_name] = rgba_rows
+        result[frame_name] = np.ascontiguousarray(crop_atlas(atlas, frame_info))
     return result
 
 def make_frame_rgba(rgba_rows):
-    height = len(rgba_rows)
-    width = len(rgba_rows[0]) if height > 0 else 0
+    # Accepts the arrays from extract_frames_rgba as well as plain lists of rows
+    pixels = np.asarray(rgba_rows, dtype=np.uint8)
+    height = pixels.shape[0] if pixels.ndim == 3 else len(rgba_rows)
+    width = pixels.shape[1] if pixels.ndim == 3 else 0
 
     surf = pygame.Surface((width, height), pygame.SRCALPHA)
-    for y in range(height):
-        for x in range(width):
-            r, g, b, a = rgba_rows[y][x]
-            surf.set_at((x, y), (r, g, b, a))
+    if width and height:
+        # surfarray is indexed [x][y], hence the transposes
+        rgb_view = pygame.surfarray.pixels3d(surf)
+        rgb_view[...] = pixels[..., :3].transpose(1, 0, 2)
+        del rgb_view
+        alpha_view = pygame.surfarray.pixels_alpha(surf)
+        alpha_view[...] = pixels[..., 3].T
+        del alpha_view
     return surf
 
 
@@ -115,33 +229,140 @@ def pil_image_to_surface(pil_image):
     mode = pil_image.mode
     size = pil_image.size
     data = pil_image.tobytes()
-    return pygame.image.fromstring(data, size, mode)
+    return convert_for_display(pygame.image.fromstring(data, size, mode))
+
+def convert_for_display(surf):
+    # Blits between surfaces in the display's own pixel format take the fast path,
+    # so every asset is converted once when it is loaded
+    if pygame.display.get_surface() is None:
+        return surf
+    if surf.get_flags() & pygame.SRCALPHA:
+        return surf.convert_alpha()
+    return surf.convert()
 
 def mask_get_bounding_rect(mask):
-    w, h = mask.get_size()
-    min_x, min_y = w, h
-    max_x, max_y = -1, -1
-    for y in range(h):
-        for x in range(w):
-            if mask.get_at((x, y)) != 0:
-                if x < min_x: min_x = x
-                if x > max_x: max_x = x
-                if y < min_y: min_y = y
-                if y > max_y: max_y = y
-    if max_x < min_x or max_y < min_y:
+    # Union of the bounding boxes of every connected blob, computed in C
+    rects = mask.get_bounding_rects()
+    if not rects:
         return pygame.Rect(0, 0, 0, 0)
-    return pygame.Rect(min_x, min_y, max_x - min_x + 1, max_y - min_y + 1)
+    return rects[0].unionall(rects[1:])
+
+# -----------------------------------------------------------------------------------
+# SPRITE CACHE
+# -----------------------------------------------------------------------------------
+# Extracting the frames pixel by pixel is slow, so every sprite sheet is baked once
+# into the cache and loaded straight from raw buffers on the next launches.
+# The cache file name contains a hash of the JSON and PNG contents, so editing an
+# asset (or bumping SPRITE_CACHE_VERSION) rebuilds it automatically.
+def cache_root():
+    # $HYPERS_CACHE_DIR if set. A bundled build runs from a temporary folder
+    # (sys._MEIPASS) that is deleted on exit, so it keeps its caches in the user's
+    # cache folder; running from source, they go in .cache/ next to the game.
+    if os.environ.get("HYPERS_CACHE_DIR"):
+        return os.environ["HYPERS_CACHE_DIR"]
+    if not hasattr(sys, '_MEIPASS'):
+        return os.path.join(base_path, ".cache")
+    if sys.platform == "win32":
+        root = os.environ.get("LOCALAPPDATA") or os.path.expanduser(os.path.join("~", "AppData", "Local"))
+    elif sys.platform == "darwin":
+        root = os.path.expanduser("~/Library/Caches")
+    else:
+        root = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(root, "HypersOnMars")
+
+CACHE_DIR = cache_root()
+SPRITE_CACHE_DIR = os.path.join(CACHE_DIR, "sprites")
+SPRITE_CACHE_VERSION = 1
+
+SpriteFrame = collections.namedtuple(
+    "SpriteFrame", ["image", "image_flipped", "mask", "mask_flipped", "ascii"])
+
+def sprite_cache_key(json_path, image_path):
+    digest = hashlib.sha1(str(SPRITE_CACHE_VERSION).encode())
+    for path in (json_path, image_path):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def mask_to_plane(mask):
+    # One byte per pixel (0 or 1), row by row
+    mask_surf = mask.to_surface()  # set bits are white, the rest black
+    plane = pygame.surfarray.array_red(mask_surf).T != 0
+    return plane.astype(np.uint8).tobytes()
+
+def mask_from_plane(plane, size):
+    # Build the mask in C: 8-bit surface where colour 0 is the colorkey
+    plane_surf = pygame.image.frombuffer(plane, size, "P")
+    plane_surf.set_colorkey(0)
+    return pygame.mask.from_surface(plane_surf)
+
+def bake_sprite_sheet(json_path, image_path):
+    frames_ascii = extract_frames_as_ascii(json_path, image_path)
+    frames_rgba  = extract_frames_rgba(json_path, image_path)
+    baked = {}
+    for frame_name, rgba_rows in frames_rgba.items():
+        surf = make_frame_rgba(rgba_rows)
+        surf_flipped = pygame.transform.flip(surf, True, False)
+        baked[frame_name] = {
+            "size": surf.get_size(),
+            "rgba": pygame.image.tostring(surf, "RGBA"),
+            "rgba_flipped": pygame.image.tostring(surf_flipped, "RGBA"),
+            "mask": mask_to_plane(pygame.mask.from_surface(surf)),
+            "mask_flipped": mask_to_plane(pygame.mask.from_surface(surf_flipped)),
+            "ascii": frames_ascii[frame_name],
+        }
+    return baked
+
+def load_sprite_sheet(json_path, image_path):
+    stem = os.path.splitext(os.path.basename(json_path))[0]
+    cache_file = os.path.join(SPRITE_CACHE_DIR,
+                              "%s-%s.pkl" % (stem, sprite_cache_key(json_path, image_path)))
+    baked = None
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                baked = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            baked = None
+
+    if baked is None:
+        baked = bake_sprite_sheet(json_path, image_path)
+        try:
+            os.makedirs(SPRITE_CACHE_DIR, exist_ok=True)
+            # Drop stale bakes of the same sheet
+            for old in os.listdir(SPRITE_CACHE_DIR):
+                if old.startswith(stem + "-") and old.endswith(".pkl"):
+                    os.remove(os.path.join(SPRITE_CACHE_DIR, old))
+            tmp_file = cache_file + ".tmp"
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(baked, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            pass  # read-only install: just keep the freshly baked frames in memory
+
+    frames = {}
+    for frame_name, entry in baked.items():
+        size = entry["size"]
+        frames[frame_name] = SpriteFrame(
+            image=convert_for_display(pygame.image.fromstring(entry["rgba"], size, "RGBA")),
+            image_flipped=convert_for_display(
+                pygame.image.fromstring(entry["rgba_flipped"], size, "RGBA")),
+            mask=mask_from_plane(entry["mask"], size),
+            mask_flipped=mask_from_plane(entry["mask_flipped"], size),
+            ascii=entry["ascii"],
+        )
+    return frames
 
 def show_intro_screen():
     # Load the images
     image1 = pygame.image.load(os.path.join(base_path,"backgrounds/intro_image0.png"))
     image2 = pygame.image.load(os.path.join(base_path,"backgrounds/intro_image1.png"))
     
-    # Scale the images to fit the screen size
-    image1 = pygame.transform.scale(image1, (WIDTH * SCALE_FACTOR, HEIGHT * SCALE_FACTOR))
-    image2 = pygame.transform.scale(image2, (WIDTH * SCALE_FACTOR, HEIGHT * SCALE_FACTOR))
+    # Scale the images to fit the world buffer (the render context upscales it)
+    image1 = convert_for_display(pygame.transform.scale(image1, (WIDTH, HEIGHT)))
+    image2 = convert_for_display(pygame.transform.scale(image2, (WIDTH, HEIGHT)))
     
-    pre_game_music.play(-1)  # Play intro music on loop
+    music.play("intro")  # Play intro music on loop
 
     # Variables for image iteration
     show_image1 = True
@@ -152,12 +373,13 @@ def show_intro_screen():
     waiting = True
     while waiting:
         for event in pygame.event.get():
+            music.handle_event(event)
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
             if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
                 waiting = False
-                pre_game_music.stop()
+                music.stop()
 
         # Alternate between images
         iteration_timer += clock.tick()
@@ -167,57 +389,304 @@ def show_intro_screen():
         
         # Display the current image
         if show_image1:
-            DISPLAY.blit(image1, (0, 0))
+            RENDER.world.blit(image1, (0, 0))
         else:
-            DISPLAY.blit(image2, (0, 0))
+            RENDER.world.blit(image2, (0, 0))
 
-        pygame.display.flip()
+        RENDER.present()
 
     return
 
+# -----------------------------------------------------------------------------------
+# AUDIO CACHE
+# -----------------------------------------------------------------------------------
+# The shipped sounds are MP3s, which the mixer would decode on every launch.
+# "python videogame.py --build-audio-cache" transcodes them once into audio/ under
+# cache_root(): effects as raw PCM in the mixer's format, read straight into a
+# Sound through a memory map, and songs as 16-bit WAV, which streams without
+# decoding. A cache file name contains a hash of the MP3, the mixer format and
+# AUDIO_CACHE_VERSION, so an edited sound or a mixer opened differently falls
+# back to the MP3 until the cache is rebuilt.
+AUDIO_CACHE_DIR = os.path.join(CACHE_DIR, "audio")
+AUDIO_CACHE_VERSION = 1
+
+_audio_digests = {}
+
+def audio_cache_file(path, extension):
+    if path not in _audio_digests:
+        digest = hashlib.sha1(str(AUDIO_CACHE_VERSION).encode())
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+        _audio_digests[path] = digest
+    digest = _audio_digests[path].copy()
+    digest.update(repr(pygame.mixer.get_init()).encode())
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(AUDIO_CACHE_DIR, "%s-%s%s" % (stem, digest.hexdigest(), extension))
+
+def load_effect(path):
+    # A Sound from the cached PCM when there is one, else decoded from the MP3
+    cache_file = audio_cache_file(path, ".pcm")
+    try:
+        with open(cache_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as pcm:
+            return pygame.mixer.Sound(buffer=pcm)  # copies the samples
+    except (OSError, ValueError):
+        return pygame.mixer.Sound(path)
+
+def song_source(path):
+    # The cached WAV of a song when there is one, else the MP3
+    cache_file = audio_cache_file(path, ".wav")
+    return cache_file if os.path.exists(cache_file) else path
+
+def write_cache_file(cache_file, write):
+    stem = os.path.basename(cache_file).rsplit("-", 1)[0]
+    for old in os.listdir(AUDIO_CACHE_DIR):
+        if old.rsplit("-", 1)[0] == stem and old.endswith(os.path.splitext(cache_file)[1]):
+            os.remove(os.path.join(AUDIO_CACHE_DIR, old))
+    tmp_file = cache_file + ".tmp"
+    write(tmp_file)
+    os.replace(tmp_file, cache_file)
+
+def build_audio_cache():
+    # Offline step; needs the mixer opened the way the game opens it
+    if not pygame.mixer.get_init():
+        try:
+            pygame.mixer.init()
+        except pygame.error:
+            # No audio device (a build machine): the format the game asks for
+            os.environ["SDL_AUDIODRIVER"] = "dummy"
+            pygame.mixer.init()
+    frequency, size, channels = pygame.mixer.get_init()
+    os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+    songs = {path for path, _ in music.tracks.values()}
+    sounds_dir = os.path.join(base_path, "sounds")
+    built = []
+    for name in sorted(os.listdir(sounds_dir)):
+        if not name.endswith(".mp3"):
+            continue
+        path = os.path.join(sounds_dir, name)
+        pcm = pygame.mixer.Sound(path).get_raw()
+        if path in songs:
+            if size != -16:
+                continue  # WAV only holds signed 16-bit here; keep streaming the MP3
+            def write(tmp_file):
+                with wave.open(tmp_file, 'wb') as out:
+                    out.setnchannels(channels)
+                    out.setsampwidth(2)
+                    out.setframerate(frequency)
+                    out.writeframes(pcm)
+            cache_file = audio_cache_file(path, ".wav")
+        else:
+            def write(tmp_file):
+                with open(tmp_file, 'wb') as out:
+                    out.write(pcm)
+            cache_file = audio_cache_file(path, ".pcm")
+        write_cache_file(cache_file, write)
+        built.append(cache_file)
+    return built
+
 ### SOUNDS INITIALIZATION ###
-# Initialize the mixer
-pygame.mixer.init()
-
-# Load sounds
-sounds = {
-    "jump": pygame.mixer.Sound(os.path.join(base_path,"sounds/jump.mp3")),
-    "shoot": pygame.mixer.Sound(os.path.join(base_path,"sounds/laser.mp3")),
-    "walk": pygame.mixer.Sound(os.path.join(base_path,"sounds/walk.mp3")),
-    "sit": pygame.mixer.Sound(os.path.join(base_path,"sounds/sit.mp3")),
-
-    "player_wins": pygame.mixer.Sound(os.path.join(base_path,"sounds/player_wins.mp3")),
-    "player_dies": pygame.mixer.Sound(os.path.join(base_path,"sounds/player_dies.mp3")),
-    "game_over": pygame.mixer.Sound(os.path.join(base_path,"sounds/game_over.mp3")),
-
-    "boss_appears": pygame.mixer.Sound(os.path.join(base_path,"sounds/boss_appears.mp3")),
-    "boss_dies": pygame.mixer.Sound(os.path.join(base_path,"sounds/boss_dies.mp3")),
-    "boss_shoots": pygame.mixer.Sound(os.path.join(base_path,"sounds/boss_laser.mp3")),
-
-    "boss_loses_life": pygame.mixer.Sound(os.path.join(base_path,"sounds/boss_loses_life.mp3")),
-    "player_loses_life": pygame.mixer.Sound(os.path.join(base_path,"sounds/player_loses_life.mp3")),
+class SoundBank:
+    # Decodes sounds on a small thread pool so the MP3s are read while the intro
+    # screen is already running. sounds["name"] only waits if that one sound
+    # hasn't finished decoding yet.
+    def __init__(self, max_workers=4):
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="sound-loader")
+        self._futures = {}
+
+    def load(self, name, path, volume=None):
+        self._futures[name] = self._executor.submit(self._decode, path, volume)
+
+    @staticmethod
+    def _decode(path, volume):
+        sound = load_effect(path)
+        if volume is not None:
+            sound.set_volume(volume)
+        return sound
+
+    def __getitem__(self, name):
+        return self._futures[name].result()
+
+# Sound effects, filled by load_sounds() (the headless simulation never plays any)
+sounds = SoundBank()
+
+def load_sounds():
+    # Initialize the mixer
+    pygame.mixer.init()
+    sounds.load("jump", os.path.join(base_path,"sounds/jump.mp3"))
+    sounds.load("shoot", os.path.join(base_path,"sounds/laser.mp3"))
+    sounds.load("walk", os.path.join(base_path,"sounds/walk.mp3"), volume=1)
+    sounds.load("sit", os.path.join(base_path,"sounds/sit.mp3"))
+
+    sounds.load("player_wins", os.path.join(base_path,"sounds/player_wins.mp3"))
+    sounds.load("player_dies", os.path.join(base_path,"sounds/player_dies.mp3"))
+    sounds.load("game_over", os.path.join(base_path,"sounds/game_over.mp3"))
+
+    sounds.load("boss_dies", os.path.join(base_path,"sounds/boss_dies.mp3"))
+    sounds.load("boss_shoots", os.path.join(base_path,"sounds/boss_laser.mp3"))
+
+    sounds.load("boss_loses_life", os.path.join(base_path,"sounds/boss_loses_life.mp3"), volume=1)
+    sounds.load("player_loses_life", os.path.join(base_path,"sounds/player_loses_life.mp3"), volume=1)
+
+    voices.setup()
+
+# Mixer channels reserved per category, and which category each effect plays in
+# with how many copies of it may sound at once
+VOICE_GROUPS = {"player": 3, "enemies": 3, "events": 3, "loops": 1}
+SoundSpec = collections.namedtuple("SoundSpec", ["group", "max_voices"])
+SOUND_SPECS = {
+    "jump":              SoundSpec("player", 1),
+    "shoot":             SoundSpec("player", 2),
+    "sit":               SoundSpec("player", 1),
+    "walk":              SoundSpec("loops", 1),
+    "boss_shoots":       SoundSpec("enemies", 2),
+    "player_loses_life": SoundSpec("events", 1),
+    "boss_loses_life":   SoundSpec("events", 1),
+    "player_dies":       SoundSpec("events", 1),
+    "boss_dies":         SoundSpec("events", 1),
+    "player_wins":       SoundSpec("events", 1),
+    "game_over":         SoundSpec("events", 1),
 }
 
+# A playing sound: which channel, what, and when it started (a play counter)
+Voice = collections.namedtuple("Voice", ["channel", "name", "serial"])
+
+class VoiceManager:
+    # Plays the effects on a fixed set of mixer channels, split by category, so
+    # rapid fire can't take every channel (or grow the mixing cost) and an enemy
+    # volley can't cut off the player's own sounds. When a sound already plays
+    # max_voices times, or its category has no free channel, the oldest voice
+    # is stolen. Looping sounds are owned by the handle play() returns.
+    def __init__(self, groups, specs):
+        self.groups = groups
+        self.specs = specs
+        self.channels = {}  # group -> [channel ids]
+        self.voices = {}    # channel id -> Voice last started on it
+        self.loops = {}     # name -> Voice of a loop started by set_loop()
+        self.serial = 0
+
+    def setup(self):
+        # Needs the mixer; every channel is reserved so that a stray
+        # Sound.play() can't land on one of them
+        total = sum(self.groups.values())
+        pygame.mixer.set_num_channels(total)
+        pygame.mixer.set_reserved(total)
+        first = 0
+        for group, count in self.groups.items():
+            self.channels[group] = list(range(first, first + count))
+            first += count
+
+    def playing(self, voice):
+        return (self.voices.get(voice.channel) is voice
+                and pygame.mixer.Channel(voice.channel).get_busy())
+
+    def pick_channel(self, name, group, max_voices):
+        busy = [v for v in (self.voices.get(c) for c in self.channels[group])
+                if v is not None and self.playing(v)]
+        same = [v for v in busy if v.name == name]
+        if len(same) >= max_voices:
+            return min(same, key=lambda v: v.serial).channel
+        free = [c for c in self.channels[group] if c not in {v.channel for v in busy}]
+        if free:
+            return free[0]
+        return min(busy, key=lambda v: v.serial).channel
+
+    def play(self, name, loops=0):
+        group, max_voices = self.specs[name]
+        channel = self.pick_channel(name, group, max_voices)
+        self.serial += 1
+        voice = Voice(channel, name, self.serial)
+        self.voices[channel] = voice
+        pygame.mixer.Channel(channel).play(sounds[name], loops)
+        return voice
+
+    def stop(self, voice):
+        # Only if the voice still plays; its channel may have been stolen since
+        if self.playing(voice):
+            pygame.mixer.Channel(voice.channel).stop()
+        if self.voices.get(voice.channel) is voice:
+            del self.voices[voice.channel]
+
+    def set_loop(self, name, on):
+        # Starts or stops the looping sound name, doing nothing if it already is
+        voice = self.loops.get(name)
+        if on and voice is None:
+            self.loops[name] = self.play(name, loops=-1)
+        elif not on and voice is not None:
+            self.stop(voice)
+            del self.loops[name]
+
+    def stop_loops(self):
+        for name in list(self.loops):
+            self.set_loop(name, False)
+
+voices = VoiceManager(VOICE_GROUPS, SOUND_SPECS)
+
+MUSIC_END_EVENT = pygame.USEREVENT + 1
+
+class MusicChannel:
+    # Songs are streamed from disk through pygame.mixer.music instead of being
+    # decoded into Sound objects that would sit in memory as PCM all session.
+    # Only one track plays at a time; queue() lines up the next one so it starts
+    # without a gap when the current one ends.
+    def __init__(self):
+        self.tracks = {}
+        self.current = None
+        self.queued = None
+
+    def add(self, name, path, volume=1.0):
+        self.tracks[name] = (path, volume)
+
+    def play(self, name, loops=-1):
+        path, volume = self.tracks[name]
+        # Replacing a track also "ends" it; don't let that look like a handoff
+        pygame.mixer.music.set_endevent()
+        pygame.mixer.music.load(song_source(path))
+        pygame.mixer.music.set_volume(volume)
+        pygame.mixer.music.play(loops)
+        pygame.event.clear(MUSIC_END_EVENT)
+        pygame.mixer.music.set_endevent(MUSIC_END_EVENT)
+        self.current = name
+        self.queued = None
+
+    def queue(self, name, loops=-1):
+        if self.current is None:
+            self.play(name, loops)
+            return
+        path, _ = self.tracks[name]
+        pygame.mixer.music.queue(song_source(path), loops=loops)
+        self.queued = name
+
+    def stop(self):
+        pygame.mixer.music.set_endevent()
+        pygame.mixer.music.stop()
+        pygame.mixer.music.unload()
+        pygame.event.clear(MUSIC_END_EVENT)
+        self.current = None
+        self.queued = None
+
+    def is_playing(self, name):
+        return self.current == name
+
+    def handle_event(self, event):
+        # MUSIC_END_EVENT fires when a track ends, queued or not
+        if event.type != MUSIC_END_EVENT:
+            return
+        if self.queued is not None:
+            self.current = self.queued
+            self.queued = None
+            pygame.mixer.music.set_volume(self.tracks[self.current][1])
+        else:
+            self.current = None
 
 # Background music
-pre_game_music = pygame.mixer.Sound(os.path.join(base_path,"sounds/intro_song.mp3"))
-spaceships_music = pygame.mixer.Sound(os.path.join(base_path,"sounds/spaceships_song.mp3"))
-final_battle_music = pygame.mixer.Sound(os.path.join(base_path,"sounds/final_battle_song.mp3"))
-
-# adjust volume 
-pre_game_music.set_volume(0.5)
-spaceships_music.set_volume(0.5)
-final_battle_music.set_volume(0.5)
-sounds['walk'].set_volume(1)
-sounds['boss_loses_life'].set_volume(1)
-sounds['player_loses_life'].set_volume(1)
+music = MusicChannel()
+music.add("intro", os.path.join(base_path,"sounds/intro_song.mp3"), volume=0.5)
+music.add("spaceships", os.path.join(base_path,"sounds/spaceships_song.mp3"), volume=0.5)
+music.add("boss_appears", os.path.join(base_path,"sounds/boss_appears.mp3"))
+music.add("final_battle", os.path.join(base_path,"sounds/final_battle_song.mp3"), volume=0.5)
 
 ## GLOBAL VARIABLES ###
-FPS = 60
-WIDTH, HEIGHT = 640, 360
-SCALE_FACTOR = 2
-DISPLAY = pygame.display.set_mode((WIDTH * SCALE_FACTOR, HEIGHT * SCALE_FACTOR))
-pygame.display.set_caption("Cyberpunk Mars")
 CLOCK = pygame.time.Clock()
 
 PLAYER_SPEED = 2.2
@@ -229,8 +698,6 @@ BLACK  = (0, 0, 0)
 WHITE  = (255, 255, 255)
 RED    = (255, 0, 0)
 
-is_walking_sound_playing = False
-
 def draw_pixel_art(surface, pixel_map, color=WHITE):
     for y, row in enumerate(pixel_map):
         for x, ch in enumerate(row):
@@ -246,48 +713,39 @@ def scale_surf(surf, factor=SCALE_FACTOR):
 # -----------------------------------------------------------------------------------
 # LOAD PLAYER
 # -----------------------------------------------------------------------------------
-json_path = "characters/player/player.json"
-image_path = "characters/player/player.png"
-
-frames_ascii = extract_frames_as_ascii(os.path.join(base_path,json_path), os.path.join(base_path,image_path))
-frames_rgba  = extract_frames_rgba(os.path.join(base_path,json_path), os.path.join(base_path,image_path))
-
-rgba_rows_0 = frames_rgba["Hyper main character0.png"]
-pl_idleL_1  = make_frame_rgba(rgba_rows_0)
-
-rgba_rows_1 = frames_rgba["Hyper main character1.png"]
-pl_idleL_2  = make_frame_rgba(rgba_rows_1)
-
-pl_runL_1   = pl_idleL_1
-rgba_rows_3 = frames_rgba["Hyper main character3.png"]
-pl_runL_2   = make_frame_rgba(rgba_rows_3)
-
-rgba_rows_5 = frames_rgba["Hyper main character5.png"]
-pl_jumpL    = make_frame_rgba(rgba_rows_5)
-
-rgba_rows_2 = frames_rgba["Hyper main character2.png"]
-pl_downL    = make_frame_rgba(rgba_rows_2)
-
-PL_IDLE_R_FRAMES = [scale_surf(pl_idleL_1, factor=1),
-                    scale_surf(pl_idleL_2, factor=1)]
-PL_RUN_R_FRAMES  = [scale_surf(pl_runL_1, factor=1),
-                    scale_surf(pl_runL_2, factor=1)]
-PL_JUMP_R_FRAMES = [scale_surf(pl_jumpL, factor=1)]
-PL_DOWN_R_FRAMES = [scale_surf(pl_downL, factor=1)]
-
-PL_IDLE_L_FRAMES = [pygame.transform.flip(f, True, False) for f in PL_IDLE_R_FRAMES]
-PL_RUN_L_FRAMES  = [pygame.transform.flip(f, True, False) for f in PL_RUN_R_FRAMES]
-PL_JUMP_L_FRAMES = [pygame.transform.flip(f, True, False) for f in PL_JUMP_R_FRAMES]
-PL_DOWN_L_FRAMES = [pygame.transform.flip(f, True, False) for f in PL_DOWN_R_FRAMES]
-
-PL_IDLE_R_MASKS = [pygame.mask.from_surface(f) for f in PL_IDLE_R_FRAMES]
-PL_IDLE_L_MASKS = [pygame.mask.from_surface(f) for f in PL_IDLE_L_FRAMES]
-PL_RUN_R_MASKS  = [pygame.mask.from_surface(f) for f in PL_RUN_R_FRAMES]
-PL_RUN_L_MASKS  = [pygame.mask.from_surface(f) for f in PL_RUN_L_FRAMES]
-PL_JUMP_R_MASKS = [pygame.mask.from_surface(f) for f in PL_JUMP_R_FRAMES]
-PL_JUMP_L_MASKS = [pygame.mask.from_surface(f) for f in PL_JUMP_L_FRAMES]
-PL_DOWN_R_MASKS = [pygame.mask.from_surface(f) for f in PL_DOWN_R_FRAMES]
-PL_DOWN_L_MASKS = [pygame.mask.from_surface(f) for f in PL_DOWN_L_FRAMES]
+def load_player_sprites():
+    global PL_IDLE_R_FRAMES, PL_RUN_R_FRAMES, PL_JUMP_R_FRAMES, PL_DOWN_R_FRAMES
+    global PL_IDLE_L_FRAMES, PL_RUN_L_FRAMES, PL_JUMP_L_FRAMES, PL_DOWN_L_FRAMES
+    global PL_IDLE_R_MASKS, PL_RUN_R_MASKS, PL_JUMP_R_MASKS, PL_DOWN_R_MASKS
+    global PL_IDLE_L_MASKS, PL_RUN_L_MASKS, PL_JUMP_L_MASKS, PL_DOWN_L_MASKS
+    player_sheet = load_sprite_sheet(os.path.join(base_path, "characters/player/player.json"),
+                                     os.path.join(base_path, "characters/player/player.png"))
+
+    pl_idleL_1 = player_sheet["Hyper main character0.png"]
+    pl_idleL_2 = player_sheet["Hyper main character1.png"]
+    pl_runL_1  = pl_idleL_1
+    pl_runL_2  = player_sheet["Hyper main character3.png"]
+    pl_jumpL   = player_sheet["Hyper main character5.png"]
+    pl_downL   = player_sheet["Hyper main character2.png"]
+
+    PL_IDLE_R_FRAMES = [pl_idleL_1.image, pl_idleL_2.image]
+    PL_RUN_R_FRAMES  = [pl_runL_1.image, pl_runL_2.image]
+    PL_JUMP_R_FRAMES = [pl_jumpL.image]
+    PL_DOWN_R_FRAMES = [pl_downL.image]
+
+    PL_IDLE_L_FRAMES = [pl_idleL_1.image_flipped, pl_idleL_2.image_flipped]
+    PL_RUN_L_FRAMES  = [pl_runL_1.image_flipped, pl_runL_2.image_flipped]
+    PL_JUMP_L_FRAMES = [pl_jumpL.image_flipped]
+    PL_DOWN_L_FRAMES = [pl_downL.image_flipped]
+
+    PL_IDLE_R_MASKS = [pl_idleL_1.mask, pl_idleL_2.mask]
+    PL_IDLE_L_MASKS = [pl_idleL_1.mask_flipped, pl_idleL_2.mask_flipped]
+    PL_RUN_R_MASKS  = [pl_runL_1.mask, pl_runL_2.mask]
+    PL_RUN_L_MASKS  = [pl_runL_1.mask_flipped, pl_runL_2.mask_flipped]
+    PL_JUMP_R_MASKS = [pl_jumpL.mask]
+    PL_JUMP_L_MASKS = [pl_jumpL.mask_flipped]
+    PL_DOWN_R_MASKS = [pl_downL.mask]
+    PL_DOWN_L_MASKS = [pl_downL.mask_flipped]
 
 # -----------------------------------------------------------------------------------
 # LOAD SPACESHIP
@@ -303,45 +761,103 @@ ship_pixels = [
     "   XXX       XXX   ",
     "     XXX   XXX     "
 ]
-ship_surf = pygame.Surface((len(ship_pixels[0]), len(ship_pixels)), pygame.SRCALPHA)
-draw_pixel_art(ship_surf, ship_pixels, RED)
-SHIP_IMG = scale_surf(ship_surf, factor=2)
+
+def load_ship_sprite():
+    global SHIP_IMG
+    ship_surf = pygame.Surface((len(ship_pixels[0]), len(ship_pixels)), pygame.SRCALPHA)
+    draw_pixel_art(ship_surf, ship_pixels, RED)
+    SHIP_IMG = convert_for_display(scale_surf(ship_surf, factor=2))
 
 # -----------------------------------------------------------------------------------
 # LOAD BOSS
 # -----------------------------------------------------------------------------------
-json_path = "characters/enemy/enemy.json"
-image_path = "characters/enemy/enemy.png"
+def load_boss_sprites():
+    global BOSS_IMG_0, BOSS_IMG_1, BOSS_IDLE_R_FRAMES, BOSS_IDLE_L_FRAMES
+    global BOSS_IDLE_R_MASKS, BOSS_IDLE_L_MASKS
+    boss_sheet = load_sprite_sheet(os.path.join(base_path, "characters/enemy/enemy.json"),
+                                   os.path.join(base_path, "characters/enemy/enemy.png"))
 
-frames_ascii_boss = extract_frames_as_ascii(os.path.join(base_path,json_path), os.path.join(base_path,image_path))
-frames_rgba_boss  = extract_frames_rgba(os.path.join(base_path,json_path), os.path.join(base_path,image_path))
+    boss_frame_0 = boss_sheet["enemy hyper0.png"]
+    boss_frame_1 = boss_sheet["enemy hyper1.png"]
 
-rgba_rows_boss0 = frames_rgba_boss["enemy hyper0.png"]
-boss_surf_0 = make_frame_rgba(rgba_rows_boss0)
+    BOSS_IMG_0 = boss_frame_0.image
+    BOSS_IMG_1 = boss_frame_1.image
 
-rgba_rows_boss1 = frames_rgba_boss["enemy hyper1.png"]
-boss_surf_1 = make_frame_rgba(rgba_rows_boss1)
+    BOSS_IDLE_R_FRAMES = [BOSS_IMG_0, BOSS_IMG_1]
+    BOSS_IDLE_L_FRAMES = [boss_frame_0.image_flipped, boss_frame_1.image_flipped]
 
-BOSS_IMG_0 = scale_surf(boss_surf_0, factor=1)
-BOSS_IMG_1 = scale_surf(boss_surf_1, factor=1)
-
-BOSS_IDLE_R_FRAMES = [BOSS_IMG_0, BOSS_IMG_1]
-BOSS_IDLE_L_FRAMES = [pygame.transform.flip(f, True, False) for f in BOSS_IDLE_R_FRAMES]
+    BOSS_IDLE_R_MASKS = [boss_frame_0.mask, boss_frame_1.mask]
+    BOSS_IDLE_L_MASKS = [boss_frame_0.mask_flipped, boss_frame_1.mask_flipped]
 
 # -----------------------------------------------------------------------------------
-# BOSS LASER
+# FRAME METADATA
 # -----------------------------------------------------------------------------------
-boss_laser_surf = pygame.Surface((3, 3), pygame.SRCALPHA)
-pygame.draw.rect(boss_laser_surf, RED, (0, 0, 3, 3))
-BOSS_LASER_IMG = scale_surf(boss_laser_surf, factor=2)
-BOSS_LASER_MASK = pygame.mask.from_surface(BOSS_LASER_IMG)
+# What the game needs to know about each animation frame, worked out once here
+# instead of scanning masks at runtime. All points are relative to the frame's
+# top-left corner: bbox is the tight box around the opaque pixels, head and foot
+# are where the boss aims, laser_spawn is where this character's lasers come out.
+FrameInfo = collections.namedtuple(
+    "FrameInfo", ["image", "mask", "bbox", "head", "foot", "laser_spawn"])
+
+def make_frame_infos(frames, masks, laser_spawn):
+    infos = []
+    for image, mask in zip(frames, masks):
+        bbox = mask_get_bounding_rect(mask)
+        center_x = bbox.left + bbox.width // 2
+        infos.append(FrameInfo(image, mask, bbox,
+                               head=(center_x, bbox.top),
+                               foot=(center_x, bbox.bottom),
+                               laser_spawn=laser_spawn(image)))
+    return infos
+
+def player_laser_spawn(image):
+    return (image.get_width() // 2, image.get_height() // 2)
+
+def boss_laser_spawn(image):
+    return (image.get_width() // 2, image.get_height() // 5)
+
+def build_frame_infos():
+    global PLAYER_FRAME_INFO, BOSS_FRAME_INFO
+    # (player_state, facing_right) -> frames of that animation
+    PLAYER_FRAME_INFO = {
+        ("idle", True):  make_frame_infos(PL_IDLE_R_FRAMES, PL_IDLE_R_MASKS, player_laser_spawn),
+        ("idle", False): make_frame_infos(PL_IDLE_L_FRAMES, PL_IDLE_L_MASKS, player_laser_spawn),
+        ("run", True):   make_frame_infos(PL_RUN_R_FRAMES, PL_RUN_R_MASKS, player_laser_spawn),
+        ("run", False):  make_frame_infos(PL_RUN_L_FRAMES, PL_RUN_L_MASKS, player_laser_spawn),
+        ("down", True):  make_frame_infos(PL_DOWN_R_FRAMES, PL_DOWN_R_MASKS, player_laser_spawn),
+        ("down", False): make_frame_infos(PL_DOWN_L_FRAMES, PL_DOWN_L_MASKS, player_laser_spawn),
+        ("jump", True):  make_frame_infos(PL_JUMP_R_FRAMES, PL_JUMP_R_MASKS, player_laser_spawn),
+        ("jump", False): make_frame_infos(PL_JUMP_L_FRAMES, PL_JUMP_L_MASKS, player_laser_spawn),
+    }
+
+    # facing_right -> boss frames (the sprite itself looks left, hence the swap)
+    BOSS_FRAME_INFO = {
+        True:  make_frame_infos(BOSS_IDLE_L_FRAMES, BOSS_IDLE_L_MASKS, boss_laser_spawn),
+        False: make_frame_infos(BOSS_IDLE_R_FRAMES, BOSS_IDLE_R_MASKS, boss_laser_spawn),
+    }
 
 # -----------------------------------------------------------------------------------
-# PLAYER LASER
+# LASERS
 # -----------------------------------------------------------------------------------
-player_laser_surf = pygame.Surface((2, 2), pygame.SRCALPHA)
-pygame.draw.rect(player_laser_surf, WHITE, (0, 0, 2, 2))
-PLAYER_LASER_IMG = scale_surf(player_laser_surf)
+def load_laser_sprites():
+    global BOSS_LASER_IMG, BOSS_LASER_MASK, SHIP_LASER_IMG, PLAYER_LASER_IMG, LASER_IMAGES
+    # Boss
+    boss_laser_surf = pygame.Surface((3, 3), pygame.SRCALPHA)
+    pygame.draw.rect(boss_laser_surf, RED, (0, 0, 3, 3))
+    BOSS_LASER_IMG = convert_for_display(scale_surf(boss_laser_surf, factor=2))
+    BOSS_LASER_MASK = pygame.mask.from_surface(BOSS_LASER_IMG)
+
+    # Ship
+    ship_laser_surf = pygame.Surface((2, 2), pygame.SRCALPHA)
+    pygame.draw.rect(ship_laser_surf, RED, (0, 0, 2, 2))
+    SHIP_LASER_IMG = convert_for_display(scale_surf(ship_laser_surf, factor=2))
+
+    # Player
+    player_laser_surf = pygame.Surface((2, 2), pygame.SRCALPHA)
+    pygame.draw.rect(player_laser_surf, WHITE, (0, 0, 2, 2))
+    PLAYER_LASER_IMG = convert_for_display(scale_surf(player_laser_surf))
+
+    LASER_IMAGES = {OWNER_PLAYER: PLAYER_LASER_IMG, OWNER_SHIP: SHIP_LASER_IMG, OWNER_BOSS: BOSS_LASER_IMG}
 
 # -----------------------------------------------------------------------------------
 # LIVES ICON
@@ -355,13 +871,16 @@ life_pixel_map = [
     " X   X ",
     "  XXX  "
 ]
-life_surf = pygame.Surface((len(life_pixel_map[0]), len(life_pixel_map)), pygame.SRCALPHA)
-draw_pixel_art(life_surf, life_pixel_map, color=WHITE)
-LIFE_IMG = scale_surf(life_surf, factor=2)
 
-life_surf_boss = pygame.Surface((len(life_pixel_map[0]), len(life_pixel_map)), pygame.SRCALPHA)
-draw_pixel_art(life_surf_boss, life_pixel_map, color=RED)
-LIFE_IMG_BOSS = scale_surf(life_surf_boss, factor=2)
+def load_life_icons():
+    global LIFE_IMG, LIFE_IMG_BOSS
+    life_surf = pygame.Surface((len(life_pixel_map[0]), len(life_pixel_map)), pygame.SRCALPHA)
+    draw_pixel_art(life_surf, life_pixel_map, color=WHITE)
+    LIFE_IMG = convert_for_display(scale_surf(life_surf, factor=2))
+
+    life_surf_boss = pygame.Surface((len(life_pixel_map[0]), len(life_pixel_map)), pygame.SRCALPHA)
+    draw_pixel_art(life_surf_boss, life_pixel_map, color=RED)
+    LIFE_IMG_BOSS = convert_for_display(scale_surf(life_surf_boss, factor=2))
 
 
 # -----------------------------------------------------------------------------------
@@ -377,706 +896,1704 @@ green_colors = [
     (14, 24, 23)
 ]
 
-sky_texture = Image.open(os.path.join(base_path,'backgrounds/sky_buildings.png'))
-sky_texture_surface = pil_image_to_surface(sky_texture)
-
-bg_layer_image = Image.open(os.path.join(base_path,'backgrounds/buildings.png'))
-bg_layer_mid = pil_image_to_surface(bg_layer_image)
-
 ground_colors = [
     (105, 105, 105),
     (193, 68, 14),
     (139, 69, 19),
     (160, 82, 45)
 ]
-ground_texture = Image.open(os.path.join(base_path,'backgrounds/ground.png'))
-ground_texture_surface = pil_image_to_surface(ground_texture)
 
-def draw_ground(surface, camera_x):
-    ground_y = GROUND_LEVEL
-    offset_x = -camera_x % ground_texture_surface.get_width()
-    for x in range(-1, (surface.get_width() // ground_texture_surface.get_width()) + 2):
-        surface.blit(ground_texture_surface, (offset_x + x * ground_texture_surface.get_width(), ground_y))
+class ParallaxLayer:
+    # A background layer scrolling at `factor` times the camera speed. The texture
+    # is baked once into a strip holding one full period plus an extra screen width
+    # copied from its start, so any scroll position is a single area-clipped blit,
+    # however wide the world is and however small the tile. An opaque layer is
+    # flattened onto black: it blits without alpha and covers the last frame.
+    def __init__(self, texture, factor, y=0, view_width=WIDTH, opaque=False):
+        self.factor = factor
+        self.y = y
+        self.period = texture.get_width()
+        self.view_width = view_width
+        height = texture.get_height()
+
+        flags = 0 if opaque else texture.get_flags() & pygame.SRCALPHA
+        strip = pygame.Surface((self.period + view_width, height), flags)
+        for x in range(0, strip.get_width(), self.period):
+            strip.blit(texture, (x, 0))
+        self.strip = convert_for_display(strip)
+        self.area = pygame.Rect(0, 0, view_width, height)
+
+    def draw(self, surface, camera_x):
+        # Blits truncate fractional positions, so do the same with the offset
+        self.area.x = int(camera_x * self.factor) % self.period
+        surface.blit(self.strip, (0, self.y), self.area)
+
+class ChunkedLayer:
+    # The world-locked layer (it scrolls with the camera), drawn as one segment
+    # per world chunk (see ChunkedWorld) cut from that chunk's texture. Segments
+    # are made when their chunk comes into view and dropped when it leaves, so
+    # memory and drawing follow the screen, not the length of the level.
+    def __init__(self, textures, y=0):
+        self.textures = textures
+        self.y = y
+        self.segments = {}  # chunk -> Surface
+
+    def segment(self, chunk, texture_id):
+        texture = self.textures[texture_id]
+        period = texture.get_width()
+        surf = pygame.Surface((CHUNK_WIDTH, texture.get_height()), texture.get_flags() & pygame.SRCALPHA)
+        for x in range(-(chunk * CHUNK_WIDTH % period), CHUNK_WIDTH, period):
+            surf.blit(texture, (x, 0))
+        return convert_for_display(surf)
+
+    def draw(self, surface, camera_x, chunk_textures):
+        # Blits truncate fractional positions, so do the same with the offset
+        offset = int(camera_x)
+        first = offset // CHUNK_WIDTH
+        last = min((offset + surface.get_width() - 1) // CHUNK_WIDTH, len(chunk_textures) - 1)
+        for chunk in [c for c in self.segments if not first <= c <= last]:
+            del self.segments[chunk]
+        for chunk in range(first, last + 1):
+            segment = self.segments.get(chunk)
+            if segment is None:
+                segment = self.segments[chunk] = self.segment(chunk, chunk_textures[chunk])
+            surface.blit(segment, (chunk * CHUNK_WIDTH - offset, self.y))
+
+def load_background():
+    global PARALLAX_LAYERS, GROUND_LAYER
+    sky_texture = Image.open(os.path.join(base_path,'backgrounds/sky_buildings.png'))
+    sky_texture_surface = pil_image_to_surface(sky_texture)
+
+    bg_layer_image = Image.open(os.path.join(base_path,'backgrounds/buildings.png'))
+    bg_layer_mid = pil_image_to_surface(bg_layer_image)
+
+    ground_texture = Image.open(os.path.join(base_path,'backgrounds/ground.png'))
+    ground_texture_surface = pil_image_to_surface(ground_texture)
+
+    # Back to front, then the ground in front of them
+    PARALLAX_LAYERS = [
+        ParallaxLayer(sky_texture_surface, 0.3, opaque=True),
+        ParallaxLayer(bg_layer_mid, 0.6),
+    ]
+    GROUND_LAYER = ChunkedLayer([ground_texture_surface], y=GROUND_LEVEL)
 
 
 # -----------------------------------------------------------------------------------
-# MAIN GAME
+# ENTITIES
 # -----------------------------------------------------------------------------------
-def main():
-    global is_walking_sound_playing  # Use the global variable for walking sound
-    # Show the intro screen
-    show_intro_screen()
+# Game objects live in component tables: one preallocated NumPy array per
+# component, one row per entity. Live rows are kept packed in [0, count) in spawn
+# order, so the systems (the GameState update methods) work on whole columns and
+# more ships, lasers or bosses are more rows, not more code.
+class ComponentTable:
+    def __init__(self, columns, capacity=64):
+        # columns: {name: dtype}
+        self.columns = dict(columns)
+        self.count = 0
+        for name, dtype in self.columns.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+        self.alive = np.zeros(capacity, dtype=bool)
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self, needed=0):
+        capacity = len(self.alive) * 2
+        while capacity < needed:
+            capacity *= 2
+        for name in list(self.columns) + ["alive"]:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def spawn(self, **values):
+        # Columns not given start at zero; returns the new row
+        if self.count == len(self.alive):
+            self._grow()
+        i = self.count
+        for name in self.columns:
+            getattr(self, name)[i] = values.get(name, 0)
+        self.alive[i] = True
+        self.count += 1
+        return i
+
+    def spawn_many(self, count, **values):
+        # Appends count rows at once; values are arrays of that length or scalars
+        if self.count + count > len(self.alive):
+            self._grow(self.count + count)
+        rows = slice(self.count, self.count + count)
+        for name in self.columns:
+            getattr(self, name)[rows] = values.get(name, 0)
+        self.alive[rows] = True
+        self.count += count
+
+    def kill(self, i):
+        # The row is dropped at the next compact()
+        self.alive[i] = False
+
+    def select(self, rows):
+        # Copies of the given rows, as spawn_many() keyword arguments
+        return {name: getattr(self, name)[:self.count][rows] for name in self.columns}
+
+    def compact(self, keep=None):
+        n = self.count
+        if keep is None:
+            keep = self.alive[:n]
+        kept = int(np.count_nonzero(keep))
+        if kept == n:
+            return
+        for name in self.columns:
+            column = getattr(self, name)
+            column[:kept] = column[:n][keep]
+        self.alive[:kept] = True
+        self.alive[kept:n] = False
+        self.count = kept
+
+# The player and the bosses. They are spawned once and never removed, so their
+# rows are fixed (the first boss is row BOSS); a boss stays inactive until it is
+# triggered. Every system handles any number of KIND_BOSS rows: each boss goes
+# through its own encounter (entrance, countdown, fight) in its actor columns.
+PLAYER = 0
+BOSS   = 1
+KIND_PLAYER = 0
+KIND_BOSS   = 1
+BOSS_ENTERING  = 0  # moving in from the right (the player finishes any jump)
+BOSS_COUNTDOWN = 1  # waiting for the player to land, then counting down
+BOSS_FIGHTING  = 2
+ACTOR_COLUMNS = {
+    "kind": np.uint8,
+    "active": bool,
+    "x": float, "y": float,
+    "prev_x": float, "prev_y": float,  # position at the start of the last tick
+    "vy": float,
+    "floor_y": float,                  # y when standing on the ground
+    "gravity": bool,
+    "on_ground": bool,
+    "facing_right": bool,
+    "hp": np.int64,
+    "invincible": bool,
+    "inv_timer": np.int64,
+    "inv_time": np.int64,              # ticks of invincibility after a hit
+    "anim_timer": np.int64,
+    "anim_index": np.int64,
+    "anim_period": np.int64,           # ticks per animation frame, 0 to hold the first
+    "frame": object,                   # current FrameInfo
+    # Boss encounters
+    "triggered": bool,                 # the level reached this boss
+    "phase": np.uint8,                 # BOSS_ENTERING... once active
+    "player_landed": bool,             # the countdown waits for the player to land
+    "countdown": np.int64,             # countdown ticks so far
+    "laser_timer": np.int64,
+    "aim_at_head": bool,               # the next laser goes for the head, else the feet
+}
 
-    # Optionally start playing the spaceship song once the intro ends
-    spaceships_music.play(-1)  # loop = -1
-    player_x = 50
-    player_y = GROUND_LEVEL - PL_IDLE_L_FRAMES[0].get_height()
-    facing_right = True
-    on_ground = True
-    player_vy = 0
-    jump_power = 5
-    player_state = "idle"
-    prev_player_state = "idle" 
-
-    anim_timer = 0
-    anim_index = 0
-    boss_anim_index = 0
-    boss_anim_timer = 0
-
-    lives = 5
-    invincible = False
-    inv_timer = 0
-
-    boss_active = False
-    boss_hp = 10
-    boss_x = WORLD_WIDTH + 100
-    boss_y = GROUND_LEVEL - BOSS_IDLE_R_FRAMES[0].get_height()
-    boss_laser_timer = 0
-    boss_invincible = False
-    boss_inv_timer = 0
-    BOSS_INV_TIME = 60
-
-    # Once boss is triggered, we do an entrance
-    boss_enter_done = False
-    # Then countdown
-    boss_fight_begun = False
-    countdown_timer = 0
-    # We freeze the camera once fight begins
-    freeze_camera = False
-    locked_camera_x = 0
-    # If the player was jumping when the boss is triggered, we let them land
-    # Then freeze everything
-    player_landed_for_cutscene = False
-
-    lasers = []
-    enemy_lasers = []
-    ships = []
-    SHIP_SPAWN_INTERVAL = 180
-    ship_timer = SHIP_SPAWN_INTERVAL
-    STOP_SPAWN_X = WORLD_WIDTH - 600
-
-    for _ in range(3):
-        sx = random.randint(WIDTH, WIDTH + 400)
-        sy = random.randint(10, 100)
-        ships.append({"x": sx, "y": sy})
-
-    camera_x = 0
-    font_large = pygame.font.Font(None, 64)
-    font_big   = pygame.font.Font(None, 22)
+SHIP_COLUMNS = {"x": float, "y": float, "vx": float, "fire_chance": float}
 
-    boss_aim_at_head = True
 
-    final_battle_music_playing = False  
-    boss_appears_playing= False
-    boss_appears_stopped= False
-    spaceships_music_stop = False
+# -----------------------------------------------------------------------------------
+# PROJECTILES
+# -----------------------------------------------------------------------------------
+OWNER_PLAYER = 0
+OWNER_SHIP   = 1
+OWNER_BOSS   = 2
+
+PLAYER_LASER_SPEED = 5
+SHIP_LASER_SPEED   = 3
+BOSS_LASER_SPEED   = 4
+
+def round_half_away(values):
+    # What Rect's topleft setter does with floats (get_rect(topleft=...))
+    return np.copysign(np.floor(np.abs(values) + 0.5), values)
+
+class ProjectilePool(ComponentTable):
+    # Every laser in the game. Movement, culling and collision tests are single
+    # NumPy operations over the [0, count) slice.
+    def __init__(self, capacity=1024):
+        super().__init__({"x": float, "y": float, "vx": float, "vy": float,
+                          "owner": np.uint8}, capacity)
+
+    def spawn(self, x, y, vx, vy, owner):
+        if self.count == len(self.x):
+            self._grow()
+        i = self.count
+        self.x[i] = x
+        self.y[i] = y
+        self.vx[i] = vx
+        self.vy[i] = vy
+        self.owner[i] = owner
+        self.alive[i] = True
+        self.count += 1
+
+    def update(self, min_x, max_x, min_y, max_y):
+        n = self.count
+        x = self.x[:n]
+        y = self.y[:n]
+        x += self.vx[:n]
+        y += self.vy[:n]
+        keep = self.alive[:n] & (x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y)
+        self.compact(keep)
+
+    def of_owner(self, owner):
+        return self.owner[:self.count] == owner
 
-    # Start the game
-    running = True
-    while running:
-        dt = CLOCK.tick(FPS)
-        keys = pygame.key.get_pressed()
 
-        # normal logic
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-                break
+# -----------------------------------------------------------------------------------
+# FLEET
+# -----------------------------------------------------------------------------------
+# The enemy ships. Spawns come from a schedule worked out in advance from the
+# waves the level starts (see LEVELS): a wave lasts `duration` spawn ticks
+# (None: until spawning stops) and every `interval` ticks sends `ships` ships
+# flying left at `speed` that fire with `fire_chance` per tick. Spawn ticks only
+# count while the level has spawning on. Moving, culling and the fire rolls are
+# one NumPy operation each, whatever the number of ships.
+Wave = collections.namedtuple(
+    "Wave", ["duration", "interval", "ships", "fire_chance", "speed"],
+    defaults=[None, 180, 1, 0.01, 1])
+
+INITIAL_SHIPS = 3
+SHIP_SPAWN_SPREAD = 400  # ships appear up to this far past the right edge of the screen
+SHIP_CULL_X = -200
+
+class Fleet:
+    SCHEDULE_BLOCK = 64  # spawns scheduled at a time for an endless wave
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.ships = ComponentTable(SHIP_COLUMNS)
+        self.timer = 0
+        self.start([], 0, initial_ships=0)
+
+    def start(self, waves, camera_x, initial_ships=INITIAL_SHIPS):
+        # Replaces the waves, counting from the next spawn tick
+        self.waves = list(waves)
+        self.wave_index = 0
+        self.wave_start = self.timer + 1
+        self.scheduled_until = self.timer + 1  # every spawn before this tick is in the schedule
+        self.schedule_done = not self.waves
+        self.schedule = {name: np.zeros(0) for name in ("tick", "offset", "y", "speed", "fire_chance")}
+        self.next = 0
+
+        # The first ships are already on their way in
+        if initial_ships:
+            wave = self.waves[0] if self.waves else Wave()
+            self.ships.spawn_many(
+                initial_ships,
+                x=camera_x + self.rng.integers(WIDTH, WIDTH + SHIP_SPAWN_SPREAD, initial_ships, endpoint=True),
+                y=self.rng.integers(10, 100, initial_ships, endpoint=True),
+                vx=-wave.speed, fire_chance=wave.fire_chance)
+
+    def extend_schedule(self):
+        wave = self.waves[self.wave_index]
+        start = self.scheduled_until
+        if wave.duration is None:
+            end = start + wave.interval * self.SCHEDULE_BLOCK
+        else:
+            end = self.wave_start + wave.duration
+        ticks = np.repeat(np.arange(start, end, wave.interval), wave.ships)
+        n = len(ticks)
+        new = {
+            "tick": ticks,
+            "offset": self.rng.integers(0, SHIP_SPAWN_SPREAD, n, endpoint=True),
+            "y": self.rng.integers(20, 100, n, endpoint=True),
+            "speed": np.full(n, wave.speed, dtype=float),
+            "fire_chance": np.full(n, wave.fire_chance, dtype=float),
+        }
+        for name, column in self.schedule.items():
+            self.schedule[name] = np.concatenate([column[self.next:], new[name]])
+        self.next = 0
+        self.scheduled_until = end
+
+        if wave.duration is not None:
+            if self.wave_index + 1 < len(self.waves):
+                self.wave_index += 1
+                self.wave_start = end
+            else:
+                self.schedule_done = True
+
+    def update(self, player_x, spawning, projectiles):
+        ships = self.ships
+        if spawning:
+            self.timer += 1
+            while not self.schedule_done and self.scheduled_until <= self.timer:
+                self.extend_schedule()
+            schedule = self.schedule
+            ticks = schedule["tick"]
+            if self.next < len(ticks) and ticks[self.next] <= self.timer:
+                due = int(np.searchsorted(ticks, self.timer, side="right"))
+                spawns = slice(self.next, due)
+                ships.spawn_many(due - self.next,
+                                 x=np.trunc(player_x + WIDTH) + schedule["offset"][spawns],
+                                 y=schedule["y"][spawns],
+                                 vx=-schedule["speed"][spawns],
+                                 fire_chance=schedule["fire_chance"][spawns])
+                self.next = due
+
+        n = ships.count
+        ships.x[:n] += ships.vx[:n]
+        ships.compact(ships.x[:n] > SHIP_CULL_X)
+
+        n = ships.count
+        firing = (self.rng.random(n) < ships.fire_chance[:n]).nonzero()[0]
+        if len(firing):
+            projectiles.spawn_many(len(firing),
+                                   x=ships.x[firing] + SHIP_IMG.get_width()//2,
+                                   y=ships.y[firing] + SHIP_IMG.get_height(),
+                                   vx=0, vy=SHIP_LASER_SPEED, owner=OWNER_SHIP)
 
-            elif event.type == pygame.KEYDOWN:
-                if not boss_active:
-                    # normal input
-                    if event.key == pygame.K_UP:
-                        if on_ground and player_state!='down':
-                            sounds["jump"].play()
-                            player_vy = -jump_power
-                            on_ground = False
-                            player_state = "jump"
-                    elif event.key == pygame.K_SPACE:
-                        sounds["shoot"].play()
-                        direction = 1 if facing_right else -1
-                        lx = player_x + (PL_IDLE_L_FRAMES[0].get_width() // 2)
-                        ly = player_y + (PL_IDLE_L_FRAMES[0].get_height() // 2)
-                        lasers.append([lx, ly, direction, "player"])
-                    elif event.key == pygame.K_DOWN:
-                        if on_ground and player_state!='down':
-                            if prev_player_state != "down":
-                                sounds["sit"].play()
-                            player_state = "down"
-                            
-                else:
-                    # Boss triggered
-                    # If we haven't begun the fight, we freeze all new input
-                    # EXCEPT we let the player finish falling if they're in mid-air
-                    if boss_fight_begun:
-
-                        if not boss_appears_stopped:
-                            sounds['boss_appears'].stop()
-                            boss_appears_stopped = True
-                        if not final_battle_music_playing:
-                            final_battle_music.play(-1)
-                            final_battle_music_playing = True  
-
-                        # fight started => normal input
-                        if event.key == pygame.K_UP:
-                            if on_ground and player_state!='down':
-                                player_vy = -jump_power
-                                on_ground = False
-                                player_state = "jump"
-                                sounds["jump"].play()
-                        elif event.key == pygame.K_SPACE:
-                            direction = 1 if facing_right else -1
-                            lx = player_x + (PL_IDLE_L_FRAMES[0].get_width() // 2)
-                            ly = player_y + (PL_IDLE_L_FRAMES[0].get_height() // 2)
-                            lasers.append([lx, ly, direction, "player"])
-                            sounds["shoot"].play()
-                        elif event.key == pygame.K_DOWN:
-                            if on_ground and player_state!='down':
-                                player_state = "down"
-                                sounds["sit"].play()
-                    else:
-                        # freeze: no new moves
 
-                        pass
+# -----------------------------------------------------------------------------------
+# WORLD STREAMING
+# -----------------------------------------------------------------------------------
+# The world is cut into chunks CHUNK_WIDTH wide. Only the chunks in a window
+# around the camera are loaded: ships are simulated and lasers kept there alone.
+# A ship leaving the window is parked in the chunk it is in, frozen, and comes
+# back when that chunk loads again; a laser leaving it is dropped, as at the
+# edges of the world. Each chunk also has its own ground segment (see
+# ChunkedLayer). The window reaches far enough ahead to hold every ship the
+# fleet spawns, so a level of any width costs what its window holds.
+CHUNK_WIDTH = 256
+STREAM_BEHIND = CHUNK_WIDTH
+STREAM_AHEAD = WIDTH // 6 + SHIP_SPAWN_SPREAD + CHUNK_WIDTH // 4  # spawn zone plus slack
+
+class ChunkedWorld:
+    def __init__(self, width=WORLD_WIDTH):
+        self.width = width
+        self.chunk_count = max(1, -(-width // CHUNK_WIDTH))
+        self.ground = np.zeros(self.chunk_count, dtype=np.int8)  # ground texture per chunk
+        self.parked = {}  # chunk -> [ship rows as spawn_many() arguments]
+        self.first = 0    # loaded chunks: [first, last]
+        self.last = self.chunk_count - 1
+        self.left = -math.inf  # and the stretch of the world they cover
+        self.right = math.inf
+
+    def chunk_of(self, x):
+        return np.clip(np.floor_divide(x, CHUNK_WIDTH), 0, self.chunk_count - 1).astype(np.int64)
+
+    def stream(self, camera_x, ships):
+        camera_x = float(camera_x)
+        first = max(0, int((camera_x - STREAM_BEHIND) // CHUNK_WIDTH))
+        last = min(self.chunk_count - 1, int((camera_x + WIDTH + STREAM_AHEAD) // CHUNK_WIDTH))
+        if (first, last) != (self.first, self.last):
+            self.first, self.last = first, last
+            # The outermost chunks reach past the edges of the world
+            self.left = first * CHUNK_WIDTH if first > 0 else -math.inf
+            self.right = (last + 1) * CHUNK_WIDTH if last < self.chunk_count - 1 else math.inf
+            for chunk in [c for c in self.parked if first <= c <= last]:
+                for rows in self.parked.pop(chunk):
+                    ships.spawn_many(len(rows["x"]), **rows)
+
+        x = ships.x[:ships.count]
+        leaving = x < self.left
+        if self.right != math.inf:
+            leaving |= x >= self.right
+        if not np.count_nonzero(leaving):
+            return
+        rows = leaving.nonzero()[0]
+        chunks = self.chunk_of(x[rows])
+        for chunk in sorted(set(chunks.tolist())):
+            self.parked.setdefault(chunk, []).append(ships.select(rows[chunks == chunk]))
+        ships.compact(~leaving)
+
+    def laser_bounds(self):
+        # Lasers live a little past the loaded chunks (and the world)
+        return max(self.left, 0) - 100, min(self.right, self.width) + 100
 
-            elif event.type == pygame.KEYUP:
-                if event.key == pygame.K_DOWN:
-                    if player_state == "down":
-                        if keys[pygame.K_LEFT] or keys[pygame.K_RIGHT]:
-                            player_state = "run"
-                            # Handle walking sound
 
-                            if not is_walking_sound_playing:  # Only play if not already playing
-                                sounds["walk"].play(-1)  # Loop the walking sound
-                                is_walking_sound_playing = True
+# -----------------------------------------------------------------------------------
+# LEVELS
+# -----------------------------------------------------------------------------------
+# A level is its width plus a list of events keyed by world x, fired once when
+# the player first gets past their x:
+#   {"x": 0,    "type": "waves", "waves": [{"interval": 180, "ships": 1}]}  start spawning
+#   {"x": 1400, "type": "stop_spawning"}
+#   {"x": 1400, "type": "music", "track": "boss_appears", "queue": "final_battle"}
+#                 the track loops forever ("loops": -1) unless another is queued
+#                 behind it, then it plays once ("loops": 0) and hands over
+#   {"x": 1400, "type": "boss"}                          trigger the next boss (one per event)
+# Events are sorted by x (file order among equal x) and walked by an EventCursor
+# that only moves forward, so a tick costs one comparison however many events
+# the level has. Levels are JSON (levels/*.json); "--compile-level IN OUT" writes
+# the binary form, already sorted: a header, the x of every event as float64
+# and the zlib-compressed JSON of the rest.
+LEVEL_MAGIC = b"HYLV"
+LEVEL_VERSION = 2
+LEVEL_HEADER = struct.Struct("<4sBII")  # magic, version, width, events
+
+LevelEvent = collections.namedtuple("LevelEvent", ["x", "type", "args"])
+
+def event_from_dict(x, entry):
+    args = {key: value for key, value in entry.items() if key not in ("x", "type")}
+    if entry["type"] == "waves":
+        args["waves"] = [Wave(**wave) for wave in args["waves"]]
+    return LevelEvent(float(x), entry["type"], args)
+
+class Level:
+    def __init__(self, width=WORLD_WIDTH, events=(), ground=None):
+        self.width = int(width)
+        self.events = sorted(events, key=lambda event: event.x)
+        self.xs = [event.x for event in self.events]
+        self.ground = ground  # ground texture per chunk, None for all 0
+
+    @classmethod
+    def from_dict(cls, data):
+        events = [event_from_dict(entry["x"], entry) for entry in data["events"]]
+        return cls(data.get("width", WORLD_WIDTH), events, data.get("ground"))
+
+    def to_dict(self):
+        events = []
+        for event in self.events:
+            args = dict(event.args)
+            if event.type == "waves":
+                args["waves"] = [wave._asdict() for wave in args["waves"]]
+            events.append(dict(x=event.x, type=event.type, **args))
+        data = {"width": self.width, "events": events}
+        if self.ground is not None:
+            data["ground"] = list(self.ground)
+        return data
+
+    def compile(self, path):
+        data = self.to_dict()
+        xs = np.array(self.xs, dtype="<f8")
+        for event in data["events"]:
+            del event["x"]
+        with open(path, "wb") as f:
+            f.write(LEVEL_HEADER.pack(LEVEL_MAGIC, LEVEL_VERSION, self.width, len(xs)))
+            f.write(xs.tobytes())
+            f.write(zlib.compress(json.dumps(data).encode()))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(LEVEL_MAGIC):
+            return cls.from_dict(json.loads(data))
+        magic, version, width, count = LEVEL_HEADER.unpack_from(data)
+        if version != LEVEL_VERSION:
+            raise ValueError("%s: level version %d, expected %d" % (path, version, LEVEL_VERSION))
+        start = LEVEL_HEADER.size
+        xs = np.frombuffer(data, dtype="<f8", count=count, offset=start).tolist()
+        rest = json.loads(zlib.decompress(data[start + 8 * count:]))
+        events = [event_from_dict(x, entry) for x, entry in zip(xs, rest["events"])]
+        return cls(width, events, rest.get("ground"))
+
+class EventCursor:
+    def __init__(self, level, x=-math.inf):
+        self.events = level.events
+        self.xs = level.xs
+        self.index = 0
+        self.seek(x)
+
+    def seek(self, x):
+        # Skips the events at or before x without firing them
+        self.index = bisect.bisect_right(self.xs, x)
+
+    def advance(self, x):
+        # The events the player got past since the last call
+        start = self.index
+        if start == len(self.xs) or self.xs[start] >= x:
+            return ()
+        end = bisect.bisect_left(self.xs, x, start)
+        self.index = end
+        return self.events[start:end]
+
+def load_level(path=None):
+    global LEVEL
+    LEVEL = Level.load(path or os.path.join(base_path, "levels/level1.json"))
 
-                            if is_walking_sound_playing:  # Only stop if the sound is playing
-                                sounds["walk"].stop()  # Stop the walking sound
-                                is_walking_sound_playing = False
 
-                        else:
-                            player_state = "idle"
+# -----------------------------------------------------------------------------------
+# GAME STATE
+# -----------------------------------------------------------------------------------
+# Everything the game remembers between frames. step() advances it by one tick
+# from an Inputs value and never draws or plays anything: sounds and music
+# changes are left in state.cues for whoever runs the loop, as (kind, argument)
+# pairs: ("sound", name), ("music_play", (track, loops)), ("music_queue", track)
+# and ("music_stop", None).
+Inputs = collections.namedtuple(
+    "Inputs", ["left", "right", "jump", "shoot", "down", "down_released"],
+    defaults=[False] * 6)
+NO_INPUTS = Inputs()
+
+def merge_inputs(pending, new):
+    # Held keys come from the newest reading, key presses are kept until a tick uses them
+    return Inputs(left=new.left, right=new.right,
+                  jump=pending.jump or new.jump,
+                  shoot=pending.shoot or new.shoot,
+                  down=pending.down or new.down,
+                  down_released=pending.down_released or new.down_released)
+
+def lerp(a, b, t):
+    return a + (b - a) * t
+
+# The simulation always advances in fixed ticks of TICK_MS, whatever the frame rate.
+# All speeds (PLAYER_SPEED, gravity, laser speeds...) are per tick.
+TICK_RATE = 60
+TICK_MS = 1000 / TICK_RATE
+MAX_CATCHUP_STEPS = 5  # after a long hitch, drop the backlog instead of spiralling
+
+BOSS_INV_TIME = 60
+JUMP_POWER = 5
+PLAYER_ANIM_PERIODS = {"idle": 20, "run": 10}  # other states hold their first frame
+BOSS_ANIM_PERIOD = 20
+
+class GameState:
+    # seed fixes every random choice of the game (ship spawns, ship fire), so the
+    # same seed and the same inputs always play out the same way. level (default:
+    # the one load_level() read) sets the length of the world, which is streamed in
+    # chunks (see ChunkedWorld), and the events met along it (see Level).
+    # Entities live in component tables (self.actors, self.ships, self.projectiles);
+    # the attributes here are the flow of the game around them.
+    def __init__(self, seed=None, level=None):
+        if seed is None:
+            seed = random.randrange(1 << 32)
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.level = level or LEVEL
+        self.world_width = world_width = self.level.width
+        self.world = ChunkedWorld(world_width)
+        if self.level.ground is not None:
+            self.world.ground[:] = self.level.ground
+        self.events = EventCursor(self.level)
+        self.spawning = False
+
+        self.actors = ComponentTable(ACTOR_COLUMNS, capacity=4)
+        player_y = GROUND_LEVEL - PL_IDLE_L_FRAMES[0].get_height()
+        self.actors.spawn(kind=KIND_PLAYER, active=True, x=50, y=player_y, prev_x=50, prev_y=player_y,
+                          floor_y=player_y, gravity=True, on_ground=True, facing_right=True,
+                          hp=5, inv_time=INV_TIME)
+        # One boss per boss event (and always at least the one in row BOSS)
+        boss_x = world_width + 100
+        boss_y = GROUND_LEVEL - BOSS_IDLE_R_FRAMES[0].get_height()
+        boss_events = sum(event.type == "boss" for event in self.level.events)
+        for _ in range(max(boss_events, 1)):
+            self.actors.spawn(kind=KIND_BOSS, active=False, x=boss_x, y=boss_y, prev_x=boss_x, prev_y=boss_y,
+                              floor_y=boss_y, on_ground=True, hp=10, inv_time=BOSS_INV_TIME,
+                              anim_period=BOSS_ANIM_PERIOD,
+                              frame=BOSS_FRAME_INFO[False][0], aim_at_head=True)
+        self.boss_rows = (self.actors.kind[:self.actors.count] == KIND_BOSS).nonzero()[0]
+
+        self.player_state = "idle"
+        self.prev_player_state = "idle"
+        self.walking = False
+
+        # We freeze the camera once a fight begins
+        self.freeze_camera = False
+        self.locked_camera_x = 0
+
+        self.projectiles = ProjectilePool()
+        self.fleet = Fleet(self.rng)
+        self.ships = self.fleet.ships
+
+        self.camera_x = 0
+        self.prev_camera_x = self.camera_x  # for render interpolation
+        self.tick = 0
+        self.running = True
+        self.cues = []
+        self.profiler = None  # a FrameProfiler while one is recording
+
+        self.set_player_frame()
+
+    def active_bosses(self):
+        # Rows of the bosses that have been triggered
+        rows = self.boss_rows
+        return rows[self.actors.active[rows]]
+
+    @property
+    def boss_active(self):
+        return np.count_nonzero(self.actors.active[self.boss_rows]) > 0
+
+    def bosses_defeated(self):
+        return np.count_nonzero(self.actors.hp[self.boss_rows] > 0) == 0
+
+    def player_frame(self):
+        a = self.actors
+        frames = PLAYER_FRAME_INFO[(self.player_state, bool(a.facing_right[PLAYER]))]
+        return frames[a.anim_index[PLAYER] % len(frames)]
+
+    def set_player_frame(self):
+        self.actors.frame[PLAYER] = self.player_frame()
+
+    def step(self, inputs):
+        # Systems in order: input, physics, AI, projectiles, camera/animation,
+        # then collisions and timers
+        self.cues = []
+        self.tick += 1
+        a = self.actors
+        a.prev_x[:a.count] = a.x[:a.count]
+        a.prev_y[:a.count] = a.y[:a.count]
+        self.prev_camera_x = self.camera_x
+        bosses = self.active_bosses()
+        boss_active = len(bosses) > 0
+        # Once a boss is triggered, the player is frozen until its fight begins
+        controls = not boss_active or np.count_nonzero(a.phase[bosses] != BOSS_FIGHTING) == 0
+        was_on_ground = bool(a.on_ground[PLAYER])
+
+        self.handle_input(inputs, controls)
         # store old state for next loop
-        prev_player_state = player_state
-        # ------------------------------------------------------------------------------
-        # If boss not active, normal movement
-        # ------------------------------------------------------------------------------
+        self.prev_player_state = self.player_state
+        if controls:
+            self.move_player(inputs)
+        else:
+            self.walking = False
+        self.apply_physics()
+        self.update_events()
+
         if not boss_active:
-            moving = False
-            if keys[pygame.K_LEFT]:
-                player_x -= PLAYER_SPEED
-                facing_right = False
-                moving = True
-                if on_ground and player_state != "down":
-                    player_state = "run"
-            elif keys[pygame.K_RIGHT]:
-                player_x += PLAYER_SPEED
-                facing_right = True
-                moving = True
-                if on_ground and player_state != "down":
-                    player_state = "run"
-            
-            # Handle walking sound
-            if moving and on_ground:
-                if not is_walking_sound_playing:
-                    sounds["walk"].play(-1)  # Loop the walking sound
-                    is_walking_sound_playing = True
+            self.update_ships()
+        self.update_boss(was_on_ground)
+        self.update_lasers()
+
+        self.update_camera()
+        self.update_animation()
+        self.set_player_frame()
+
+        bosses = self.active_bosses()
+        if len(bosses):
+            for i in bosses[a.phase[bosses] == BOSS_FIGHTING].tolist():
+                self.boss_shoot(i)
+        if self.profiler:
+            self.profiler.mark("update")
+
+        self.check_player_hits()
+        if self.boss_active:
+            self.check_boss_hits()
+        self.projectiles.compact()
+        if self.profiler:
+            self.profiler.mark("collisions")
+
+        self.update_timers()
+
+    def handle_input(self, inputs, controls):
+        a = self.actors
+        if controls and inputs.jump:
+            if a.on_ground[PLAYER] and self.player_state != 'down':
+                self.cues.append(("sound", "jump"))
+                a.vy[PLAYER] = -JUMP_POWER
+                a.on_ground[PLAYER] = False
+                self.player_state = "jump"
+        if controls and inputs.shoot:
+            self.cues.append(("sound", "shoot"))
+            direction = 1 if a.facing_right[PLAYER] else -1
+            laser_spawn = a.frame[PLAYER].laser_spawn
+            lx = a.x[PLAYER] + laser_spawn[0]
+            ly = a.y[PLAYER] + laser_spawn[1]
+            self.projectiles.spawn(lx, ly, PLAYER_LASER_SPEED * direction, 0, OWNER_PLAYER)
+        if controls and inputs.down:
+            if a.on_ground[PLAYER] and self.player_state != 'down':
+                if self.prev_player_state != "down":
+                    self.cues.append(("sound", "sit"))
+                self.player_state = "down"
+
+        if inputs.down_released and self.player_state == "down":
+            if inputs.left or inputs.right:
+                self.player_state = "run"
             else:
-                if is_walking_sound_playing:
-                    sounds["walk"].stop()  # Stop the walking sound
-                    is_walking_sound_playing = False
-
-            if not moving and on_ground and player_state not in ("down", "jump"):
-                player_state = "idle"
-
-            if not on_ground:
-                # gravity
-                player_vy += 0.2
-                player_y += player_vy
-                if player_y >= GROUND_LEVEL - PL_IDLE_L_FRAMES[0].get_height():
-                    player_y = GROUND_LEVEL - PL_IDLE_L_FRAMES[0].get_height()
-                    player_vy = 0
-                    on_ground = True
-                    if player_state != "down":
-                        player_state = "idle"
-
-            if player_x < 0:
-                player_x = 0
-            if player_x > WORLD_WIDTH - 20:
-                player_x = WORLD_WIDTH - 20
-
-            # spawn ships
-            if player_x < STOP_SPAWN_X:
-                ship_timer += 1
-                if ship_timer > SHIP_SPAWN_INTERVAL:
-                    ship_timer = 0
-                    sx = random.randint(int(player_x + WIDTH), int(player_x + WIDTH + 400))
-                    sy = random.randint(20, 100)
-                    ships.append({"x": sx, "y": sy})
-
-            for s in ships:
-                s["x"] -= 1
-            ships = [s for s in ships if s["x"] > -200]
-
-            for s in ships:
-                if random.random() < 0.01:
-                    ex = s["x"] + SHIP_IMG.get_width()//2
-                    ey = s["y"] + SHIP_IMG.get_height()
-                    enemy_lasers.append([ex, ey, 3, "ship"])
-
-            for l in lasers:
-                if l[3] == "player":
-                    l[0] += 5 * l[2]
-            lasers = [l for l in lasers if -100 < l[0] < WORLD_WIDTH+100]
-
-            # move enemy lasers
-            to_remove = []
-            for el in enemy_lasers:
-                if el[3] == "ship":
-                    el[1] += 3
-                if (el[0]<-100 or el[0]>WORLD_WIDTH+100 or
-                    el[1]<-50  or el[1]>HEIGHT+50):
-                    to_remove.append(el)
-            for x_ in to_remove:
-                if x_ in enemy_lasers:
-                    enemy_lasers.remove(x_)
-
+                self.player_state = "idle"
+
+    def move_player(self, inputs):
+        a = self.actors
+        on_ground = a.on_ground[PLAYER]
+        moving = False
+        if inputs.left:
+            a.x[PLAYER] -= PLAYER_SPEED
+            a.facing_right[PLAYER] = False
+            moving = True
+            if on_ground and self.player_state != "down":
+                self.player_state = "run"
+        elif inputs.right:
+            a.x[PLAYER] += PLAYER_SPEED
+            a.facing_right[PLAYER] = True
+            moving = True
+            if on_ground and self.player_state != "down":
+                self.player_state = "run"
+
+        self.walking = moving and bool(on_ground)
+
+        if not moving and on_ground and self.player_state not in ("down", "jump"):
+            self.player_state = "idle"
+
+    def apply_physics(self):
+        # Gravity for every airborne actor that has it, then the player is kept
+        # inside the world
+        a = self.actors
+        n = a.count
+        if np.count_nonzero(a.on_ground[:n]) < n:
+            falling = (a.gravity[:n] & a.active[:n] & ~a.on_ground[:n]).nonzero()[0]
+            a.vy[falling] += 0.2
+            a.y[falling] += a.vy[falling]
+            landed = falling[a.y[falling] >= a.floor_y[falling]]
+            a.y[landed] = a.floor_y[landed]
+            a.vy[landed] = 0
+            a.on_ground[landed] = True
+            if np.count_nonzero(landed == PLAYER) and self.player_state != "down":
+                self.player_state = "idle"
+
+        if a.x[PLAYER] < 0:
+            a.x[PLAYER] = 0
+        if a.x[PLAYER] > self.world_width - 20:
+            a.x[PLAYER] = self.world_width - 20
+
+    def update_events(self):
+        for event in self.events.advance(self.actors.x[PLAYER]):
+            if event.type == "waves":
+                self.fleet.start(event.args["waves"], self.camera_x)
+                self.spawning = True
+            elif event.type == "stop_spawning":
+                self.spawning = False
+            elif event.type == "music":
+                # A track with another queued behind it plays once, so that it ends
+                queue = event.args.get("queue")
+                loops = event.args.get("loops", 0 if queue else -1)
+                self.cues.append(("music_stop", None))
+                self.cues.append(("music_play", (event.args["track"], loops)))
+                if queue:
+                    self.cues.append(("music_queue", queue))
+            elif event.type == "boss":
+                # Each boss event brings in the next boss that hasn't come yet
+                a = self.actors
+                waiting = self.boss_rows[~a.triggered[self.boss_rows]]
+                if len(waiting):
+                    a.triggered[waiting[0]] = True
+
+    def update_ships(self):
+        self.world.stream(self.camera_x, self.ships)
+        self.fleet.update(self.actors.x[PLAYER], self.spawning, self.projectiles)
+
+    def update_lasers(self):
+        min_x, max_x = self.world.laser_bounds()
+        self.projectiles.update(min_x, max_x, -50, HEIGHT + 50)
+
+    def update_boss(self, was_on_ground):
+        for i in self.boss_rows.tolist():
+            self.update_encounter(i, was_on_ground)
+
+    def update_encounter(self, i, was_on_ground):
+        a = self.actors
+        if not a.active[i]:
             # Activate boss
-            if player_x > WORLD_WIDTH - 600:
-                boss_active = True
-                player_state = "idle"
-                anim_index = 0
+            if a.triggered[i]:
+                a.active[i] = True
+                self.player_state = "idle"
+                a.anim_index[PLAYER] = 0
+
+        # 1) The boss enters from the right (the player finishes any jump meanwhile)
+        elif a.phase[i] == BOSS_ENTERING:
+            # if on_ground => we can say the player has now landed
+            if a.on_ground[PLAYER]:
+                a.player_landed[i] = True
+
+            # The boss moves in from the right
+            if a.x[i] > self.world_width - 300:
+                a.x[i] -= BOSS_SPEED_ENTER
+            else:
+                a.x[i] = self.world_width - 300
+                a.phase[i] = BOSS_COUNTDOWN
+
+        # 2) Once the boss has “entered,” we freeze everything if we have also landed
+        elif a.phase[i] == BOSS_COUNTDOWN:
+            # We only start the countdown once the player has landed (counted
+            # from where the player was at the start of this tick)
+            if not a.player_landed[i] and was_on_ground:
+                a.player_landed[i] = True
+
+            # If we have landed, we do the countdown
+            if a.player_landed[i]:
+                if a.countdown[i] < 4*FPS:
+                    # freeze everything: no boss follow, no movement
+                    a.countdown[i] += 1
+                else:
+                    # fight starts
+                    a.phase[i] = BOSS_FIGHTING
+                    self.freeze_camera = True
+                    self.locked_camera_x = self.camera_x
+                    # boss_appears may already have handed over to it
+                    self.cues.append(("music_play", ("final_battle", -1)))
 
         else:
-            # ------------------------------------------------------------------------------
-            # BOSS Active
-            # ------------------------------------------------------------------------------
-            # 1) The boss enters from the right
-            if not boss_enter_done:
-                # play boss_appears_countdown if not already playing
-                if not spaceships_music_stop:
-                    spaceships_music.stop()
-                    spaceships_music_stop = True
-
-                if not boss_appears_playing:
-                    sounds['boss_appears'].play() # loop during entrance + countdown
-                    boss_appears_playing = True
-                # Keep letting the player finish their jump if mid-air:
-                if not on_ground:
-                    player_vy += 0.2
-                    player_y += player_vy
-                    if player_y >= GROUND_LEVEL - PL_IDLE_L_FRAMES[0].get_height():
-                        player_y = GROUND_LEVEL - PL_IDLE_L_FRAMES[0].get_height()
-                        player_vy = 0
-                        on_ground = True
-                        player_state = "idle"
-
-                # if on_ground => we can say the player has now landed
-                if on_ground:
-                    player_landed_for_cutscene = True
-
-                if is_walking_sound_playing:
-                    sounds["walk"].stop()
-                    is_walking_sound_playing = False
-
-                # The boss moves in from the right
-                if boss_x > WORLD_WIDTH - 300:
-                    boss_x -= BOSS_SPEED_ENTER
+            # 3) Boss fight begun => the boss now follows horizontally
+            if a.x[PLAYER] > a.x[i]:
+                a.x[i] += BOSS_SPEED
+            elif a.x[PLAYER] < a.x[i]:
+                a.x[i] -= BOSS_SPEED
+
+            left_bound = self.camera_x
+            right_bound_alien = self.camera_x + WIDTH - PL_IDLE_L_FRAMES[0].get_width()
+            if a.x[PLAYER] < left_bound:
+                a.x[PLAYER] = left_bound
+            if a.x[PLAYER] > right_bound_alien:
+                a.x[PLAYER] = right_bound_alien
+
+            right_bound_boss = self.camera_x + WIDTH - BOSS_IDLE_R_FRAMES[0].get_width()
+            if a.x[i] < self.camera_x:
+                a.x[i] = self.camera_x
+            if a.x[i] > right_bound_boss:
+                a.x[i] = right_bound_boss
+
+    def update_camera(self):
+        if self.freeze_camera:
+            self.camera_x = self.locked_camera_x
+        else:
+            self.camera_x = self.actors.x[PLAYER] - (WIDTH // 6)
+            if self.camera_x < 0:
+                self.camera_x = 0
+            if self.camera_x > self.world_width - WIDTH:
+                self.camera_x = self.world_width - WIDTH
+
+    def update_animation(self):
+        a = self.actors
+        n = a.count
+        a.anim_period[PLAYER] = PLAYER_ANIM_PERIODS.get(self.player_state, 0)
+        timer = a.anim_timer[:n]
+        index = a.anim_index[:n]
+        period = a.anim_period[:n]
+        timer += 1
+        hold = period == 0
+        advance = (timer > period) & ~hold
+        timer[advance] = 0
+        index[advance] = (index[advance] + 1) % 2
+        index[hold] = 0
+
+        # Bosses always face the player
+        bosses = self.active_bosses()
+        if len(bosses):
+            facing = a.x[PLAYER] > a.x[bosses]
+            a.facing_right[bosses] = facing
+            for i, facing_right, anim_index in zip(bosses.tolist(), facing.tolist(),
+                                                   a.anim_index[bosses].tolist()):
+                a.frame[i] = BOSS_FRAME_INFO[facing_right][anim_index]
+
+    def boss_shoot(self, i):
+        a = self.actors
+        a.laser_timer[i] += 1
+        if a.laser_timer[i] <= 70:
+            return
+        a.laser_timer[i] = 0
+        ex = a.x[i] + a.frame[i].laser_spawn[0]
+        ey = a.y[i] + a.frame[i].laser_spawn[1]
+
+        # Alternate between the player's head and feet
+        if a.aim_at_head[i]:
+            target = a.frame[PLAYER].head
+        else:
+            target = a.frame[PLAYER].foot
+        a.aim_at_head[i] = not a.aim_at_head[i]
+        target_x = a.x[PLAYER] + target[0]
+        target_y = a.y[PLAYER] + target[1]
+
+        dx = target_x - ex
+        dy = target_y - ey
+        dist = math.sqrt(dx*dx + dy*dy)
+        if dist != 0:
+            dx /= dist
+            dy /= dist
+        vx = dx * BOSS_LASER_SPEED
+        vy = dy * BOSS_LASER_SPEED
+
+        self.projectiles.spawn(ex, ey, vx, vy, OWNER_BOSS)
+        self.cues.append(("sound", "boss_shoots"))
+
+    def projectile_candidates(self, rect):
+        # Projectiles that might touch rect, in index order: a rect test over all
+        # of them, widened by the largest laser (and a pixel for rounding). It is
+        # a handful of array comparisons, so the exact tests only see a few lasers
+        pool = self.projectiles
+        x = pool.x[:pool.count]
+        y = pool.y[:pool.count]
+        w, h = BOSS_LASER_IMG.get_size()
+        near = ((x > rect.left - w - 1) & (x < rect.right + 1) &
+                (y > rect.top - h - 1) & (y < rect.bottom + 1))
+        return near.nonzero()[0]
+
+    def check_player_hits(self):
+        a = self.actors
+        frame = a.frame[PLAYER]
+        player_rect = frame.image.get_rect(topleft=(a.x[PLAYER], a.y[PLAYER]))
+        pool = self.projectiles
+        candidates = self.projectile_candidates(player_rect)
+        if len(candidates) == 0:
+            return
+        x = pool.x[candidates]
+        y = pool.y[candidates]
+        owner = pool.owner[candidates]
+        is_boss = owner == OWNER_BOSS
+        is_ship = owner == OWNER_SHIP
+
+        # Rects the way pygame would build them: boss lasers through get_rect
+        # (rounded), ship lasers through Rect() (truncated)
+        left = np.where(is_boss, round_half_away(x), np.trunc(x))
+        top = np.where(is_boss, round_half_away(y), np.trunc(y))
+        size = np.where(is_boss, BOSS_LASER_IMG.get_width(), 2*SCALE_FACTOR)
+        touching = ((is_boss | is_ship) &
+                    (left < player_rect.right) & (left + size > player_rect.left) &
+                    (top < player_rect.bottom) & (top + size > player_rect.top))
+
+        for j in np.flatnonzero(touching).tolist():
+            if is_boss[j]:
+                offset_x = int(left[j]) - player_rect.x
+                offset_y = int(top[j]) - player_rect.y
+                overlap = frame.mask.overlap(BOSS_LASER_MASK, (offset_x, offset_y))
+            else:
+                overlap = True
+            if overlap:
+                if not a.invincible[PLAYER]:
+                    a.hp[PLAYER] -= 1
+                    if a.hp[PLAYER] > 0:
+                        self.cues.append(("sound", "player_loses_life"))
+                        a.invincible[PLAYER] = True
+                        a.inv_timer[PLAYER] = 0
+                    else:
+                        self.running = False
+                        self.cues.append(("sound", "player_dies"))
+                        self.cues.append(("music_stop", None))
+                pool.kill(int(candidates[j]))
+                break
+
+    def check_boss_hits(self):
+        a = self.actors
+        pool = self.projectiles
+        w, h = PLAYER_LASER_IMG.get_size()
+        bosses = self.active_bosses()
+        for i in bosses[a.hp[bosses] > 0].tolist():
+            if a.invincible[i]:
+                continue
+            boss_rect = a.frame[i].image.get_rect(topleft=(a.x[i], a.y[i]))
+            candidates = self.projectile_candidates(boss_rect)
+            left = round_half_away(pool.x[candidates])
+            top = round_half_away(pool.y[candidates])
+            touching = (pool.alive[candidates] & (pool.owner[candidates] == OWNER_PLAYER) &
+                        (left < boss_rect.right) & (left + w > boss_rect.left) &
+                        (top < boss_rect.bottom) & (top + h > boss_rect.top))
+            hits = candidates[touching]
+            if len(hits):
+                a.hp[i] -= 1
+                if a.hp[i] > 0:
+                    self.cues.append(("sound", "boss_loses_life"))
                 else:
-                    boss_x = WORLD_WIDTH - 300
-                    boss_enter_done = True
-
-            # 2) Once the boss has “entered,” we freeze everything if we have also landed
-            elif not boss_fight_begun:
-                # At this point, the boss is at final x. We want to do a countdown.
-                # We only start the countdown if the player has landed
-                if not player_landed_for_cutscene:
-                    # still mid-air => apply gravity until they land
-                    if not on_ground:
-                        player_vy += 0.2
-                        player_y += player_vy
-                        if player_y >= GROUND_LEVEL - PL_IDLE_L_FRAMES[0].get_height():
-                            player_y = GROUND_LEVEL - PL_IDLE_L_FRAMES[0].get_height()
-                            player_vy = 0
-                            on_ground = True
-                            player_state = "idle"
+                    self.cues.append(("sound", "boss_dies"))
+                pool.kill(int(hits[0]))
+                a.invincible[i] = True
+                a.inv_timer[i] = 0
 
-                    else:
-                        # once on_ground, set landed_for_cutscene = True
-                        player_landed_for_cutscene = True
-
-                # If we have landed, we do the countdown
-                if player_landed_for_cutscene:
-                    if countdown_timer < 4*FPS:
-                        countdown_timer += 1
-                        # freeze everything: no boss follow, no movement
-                        # so do NOT do boss_x +/- BOSS_SPEED, do not do player movement
-                    else:
-                        # fight starts
-                        boss_fight_begun = True
-                        freeze_camera = True
-                        locked_camera_x = camera_x
+        if self.bosses_defeated():
+            self.running = False
+            self.cues.append(("music_stop", None))
 
-            else:
-                # 3) Boss fight begun => normal movement
-                moving = False
-                if keys[pygame.K_LEFT]:
-                    player_x -= PLAYER_SPEED
-                    facing_right = False
-                    moving = True
-                    if on_ground and player_state != "down":
-                        player_state = "run"
-                    # Handle walking sound
-                    if moving and on_ground:  # Player is walking
-                        if not is_walking_sound_playing:  # Only play if not already playing
-                            sounds["walk"].play(-1)  # Loop the walking soun
-                            is_walking_sound_playing = True
-                    else:  # Player is not walking
-                        if is_walking_sound_playing:  # Only stop if the sound is playing
-                            sounds["walk"].stop()  # Stop the walking sound
-                            is_walking_sound_playing = False
-
-                elif keys[pygame.K_RIGHT]:
-                    player_x += PLAYER_SPEED
-                    facing_right = True
-                    moving = True
-                    if on_ground and player_state != "down":
-                        player_state = "run"
-                    # Handle walking sound
-
-                    if moving and on_ground:  # Player is walking
-                        if not is_walking_sound_playing:  # Only play if not already playing
-                            sounds["walk"].play(-1)  # Loop the walking sound
-                            is_walking_sound_playing = True
-                    else:  # Player is not walking
-                        if is_walking_sound_playing:  # Only stop if the sound is playing
-                            sounds["walk"].stop()  # Stop the walking sound
-                            is_walking_sound_playing = False
-
-
-                if not moving and on_ground and player_state not in ("down","jump"):
-                    player_state = "idle"
-
-                if not on_ground:
-                    player_vy += 0.2
-                    player_y += player_vy
-                    if player_y >= GROUND_LEVEL - PL_IDLE_L_FRAMES[0].get_height():
-                        player_y = GROUND_LEVEL - PL_IDLE_L_FRAMES[0].get_height()
-                        player_vy = 0
-                        on_ground = True
-                        if player_state != "down":
-                            player_state = "idle"
-
-                # The boss now follows horizontally
-                if player_x > boss_x:
-                    boss_x += BOSS_SPEED
-                elif player_x < boss_x:
-                    boss_x -= BOSS_SPEED
-
-                if player_x < 0:
-                    player_x = 0
-                if player_x > WORLD_WIDTH - 20:
-                    player_x = WORLD_WIDTH - 20
-                
-                left_bound = camera_x
-                right_bound_alien = camera_x + WIDTH - PL_IDLE_L_FRAMES[0].get_width()
-                if player_x < left_bound:
-                    player_x = left_bound
-                if player_x > right_bound_alien:
-                    player_x = right_bound_alien
-
-                right_bound_boss = camera_x + WIDTH - BOSS_IDLE_R_FRAMES[0].get_width()
-                if boss_x < camera_x:
-                    boss_x = camera_x
-                if boss_x > right_bound_boss:
-                    boss_x = right_bound_boss
-
-
-
-
-            # Move player's lasers
-            for l in lasers:
-                if l[3] == "player":
-                    l[0] += 5 * l[2]
-            lasers = [l for l in lasers if -100 < l[0] < WORLD_WIDTH+100]
-
-            # Move enemy lasers
-            to_remove = []
-            for el in enemy_lasers:
-                if len(el) == 5 and el[4] == "boss":
-                    el[0] += el[2]
-                    el[1] += el[3]
-                elif len(el) == 4 and el[3] == "ship":
-                    el[1] += 3
-
-                if (el[0]<-100 or el[0]>WORLD_WIDTH+100 or
-                    el[1]<-50  or el[1]>HEIGHT+50):
-                    to_remove.append(el)
-            for x_ in to_remove:
-                if x_ in enemy_lasers:
-                    enemy_lasers.remove(x_)
-
-        # CAMERA
-        if freeze_camera:
-            camera_x = locked_camera_x
-        else:
-            camera_x = player_x - (WIDTH // 6)
-            if camera_x < 0:
-                camera_x = 0
-            if camera_x > WORLD_WIDTH - WIDTH:
-                camera_x = WORLD_WIDTH - WIDTH
-
-        # ANIMATION
-        anim_timer += 1
-        if player_state == "idle":
-            if anim_timer > 20:
-                anim_timer = 0
-                anim_index = (anim_index + 1) % 2
-        elif player_state == "run":
-            if anim_timer > 10:
-                anim_timer = 0
-                anim_index = (anim_index + 1) % 2
-        elif player_state == "down":
-            anim_index = 0
+    def update_timers(self):
+        # Invincibility wears off after each actor's inv_time
+        a = self.actors
+        n = a.count
+        invincible = a.invincible[:n]
+        if np.count_nonzero(invincible):
+            a.inv_timer[:n][invincible] += 1
+            invincible &= a.inv_timer[:n] <= a.inv_time[:n]
+
+
+# -----------------------------------------------------------------------------------
+# DRAW
+# -----------------------------------------------------------------------------------
+class SpriteBatch:
+    # Collects (image, position) draw commands per layer during a frame, then
+    # flush() draws each layer with a single Surface.blits() call, back to front
+    # in the order the layers were given.
+    def __init__(self, layers):
+        self.layers = {name: [] for name in layers}
+
+    def add(self, layer, image, pos):
+        self.layers[layer].append((image, pos))
+
+    def add_many(self, layer, image, xs, ys):
+        self.layers[layer].extend([(image, pos) for pos in zip(xs, ys)])
+
+    def flush(self, surface):
+        for commands in self.layers.values():
+            if commands:
+                surface.blits(commands, doreturn=False)
+                commands.clear()
+
+SPRITE_BATCH = SpriteBatch(["ships", "enemy_lasers", "boss", "player", "player_lasers", "hud"])
+
+class TextCache:
+    # Rendered strings by (font, text, color), so text that stays on screen is
+    # rasterized once; the least recently used entries are dropped past max_entries
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+
+    def render(self, font, text, color, antialias=True):
+        key = (font, text, color, antialias)
+        surf = self.entries.get(key)
+        if surf is not None:
+            self.entries.move_to_end(key)
+            return surf
+        surf = convert_for_display(font.render(text, antialias, color))
+        self.entries[key] = surf
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return surf
+
+TEXT_CACHE = TextCache()
+
+class HudLayer:
+    # The life icons of the player and the boss, composed onto one strip across
+    # the top of the screen. The strip is only rebuilt when what it shows changes,
+    # so a frame costs one blit however many icons.
+    def __init__(self):
+        self.key = None
+        self.surface = None
+
+    def update(self, lives, boss_hp):
+        key = (lives, boss_hp)
+        if key != self.key:
+            self.key = key
+            self.surface = self.compose(lives, boss_hp)
+        return self.surface
+
+    def compose(self, lives, boss_hp):
+        icons = []
+        for i in range(lives):
+            offset_x = 5 + (LIFE_IMG.get_width() + 2)*i
+            icons.append((LIFE_IMG, (offset_x, 5)))
+        for i in range(boss_hp):
+            x_off = 480 + (LIFE_IMG_BOSS.get_width()+2)*i
+            y_off = LIFE_IMG_BOSS.get_height() - 10
+            icons.append((LIFE_IMG_BOSS, (x_off, y_off)))
+        height = max([pos[1] + image.get_height() for image, pos in icons], default=1)
+        surface = pygame.Surface((WIDTH, height), pygame.SRCALPHA)
+        surface.blits(icons, doreturn=False)
+        return convert_for_display(surface)
+
+HUD = HudLayer()
+
+def countdown_text(ticks):
+    sec = ticks // FPS
+    if   sec == 0: return "3..."
+    elif sec == 1: return "2..."
+    elif sec == 2: return "1..."
+    else:          return "FIGHT!"
+
+def draw_world(world_surf, state, font_large, alpha=1.0):
+    # alpha is how far we are between the last two ticks (0..1): positions are
+    # interpolated so motion stays smooth when frames and ticks don't line up.
+    # Ships and lasers move in straight lines, so their previous position is
+    # simply one tick of velocity back.
+    back = 1.0 - alpha
+    camera_x = lerp(state.prev_camera_x, state.camera_x, alpha)
+    for layer in PARALLAX_LAYERS:
+        layer.draw(world_surf, camera_x)
+    GROUND_LAYER.draw(world_surf, camera_x, state.world.ground)
+
+    batch = SPRITE_BATCH
+    ships = state.ships
+    ships_x = ships.x[:ships.count] - ships.vx[:ships.count] * back - camera_x
+    on_screen = (ships_x > -50) & (ships_x < WIDTH + 50)
+    batch.add_many("ships", SHIP_IMG, ships_x[on_screen].tolist(),
+                   ships.y[:ships.count][on_screen].tolist())
+
+    # Lasers off screen are dropped here, in bulk, rather than clipped by blit
+    pool = state.projectiles
+    n = pool.count
+    lasers_x = pool.x[:n] - pool.vx[:n] * back - camera_x
+    lasers_y = pool.y[:n] - pool.vy[:n] * back
+    owners = pool.owner[:n]
+    visible = (lasers_x > -10) & (lasers_x < WIDTH) & (lasers_y > -10) & (lasers_y < HEIGHT)
+    enemy = visible & (owners != OWNER_PLAYER)
+    batch.layers["enemy_lasers"].extend([
+        (LASER_IMAGES[owner], (x, y)) for owner, x, y in
+        zip(owners[enemy].tolist(), lasers_x[enemy].tolist(), lasers_y[enemy].tolist())])
+    mine = visible & (owners == OWNER_PLAYER)
+    batch.add_many("player_lasers", PLAYER_LASER_IMG, lasers_x[mine].tolist(), lasers_y[mine].tolist())
+
+    # Invincible actors blink
+    a = state.actors
+    blink_off = (pygame.time.get_ticks() // 100) % 2 == 0
+    for i in range(a.count):
+        if not a.active[i] or (a.invincible[i] and blink_off):
+            continue
+        x = lerp(a.prev_x[i], a.x[i], alpha) - camera_x
+        y = lerp(a.prev_y[i], a.y[i], alpha)
+        if a.kind[i] == KIND_BOSS:
+            if -100 < x < WIDTH + 100:
+                batch.add("boss", a.frame[i].image, (x, y))
         else:
-            anim_index = 0
-
-        boss_anim_timer += 1
-        if boss_anim_timer > 20:
-            boss_anim_timer = 0
-            boss_anim_index = (boss_anim_index + 1) % 2
-
-        # Determine current frame
-        if player_state == "idle":
-            frame_img = PL_IDLE_R_FRAMES[anim_index] if facing_right else PL_IDLE_L_FRAMES[anim_index]
-            frame_mask = PL_IDLE_R_MASKS[anim_index] if facing_right else PL_IDLE_L_MASKS[anim_index]
-        elif player_state == "run":
-            frame_img = PL_RUN_R_FRAMES[anim_index] if facing_right else PL_RUN_L_FRAMES[anim_index]
-            frame_mask = PL_RUN_R_MASKS[anim_index] if facing_right else PL_RUN_L_MASKS[anim_index]
-        elif player_state == "down":
-            frame_img = PL_DOWN_R_FRAMES[0] if facing_right else PL_DOWN_L_FRAMES[0]
-            frame_mask = PL_DOWN_R_MASKS[0] if facing_right else PL_DOWN_L_MASKS[0]
-        else:  # jump
-            frame_img = PL_JUMP_R_FRAMES[0] if facing_right else PL_JUMP_L_FRAMES[0]
-            frame_mask = PL_JUMP_R_MASKS[0] if facing_right else PL_JUMP_L_MASKS[0]
-
-        player_rect = frame_img.get_rect(topleft=(player_x, player_y))
-
-        # BOSS SHOOT
-        if boss_active and boss_fight_begun:
-            boss_laser_timer += 1
-            if boss_laser_timer > 70:
-                boss_laser_timer = 0
-                ex = boss_x + BOSS_IDLE_R_FRAMES[0].get_width() // 2
-                ey = boss_y + BOSS_IDLE_R_FRAMES[0].get_height() // 5
-
-                clip_rect = mask_get_bounding_rect(frame_mask)
-                player_top = player_y + clip_rect.top
-                player_bottom = player_top + clip_rect.height
-                player_center_x = player_x + clip_rect.left + (clip_rect.width // 2)
-
-                if boss_aim_at_head:
-                    target_x = player_center_x
-                    target_y = player_top
-                    boss_aim_at_head = False
-                else:
-                    target_x = player_center_x
-                    target_y = player_bottom
-                    boss_aim_at_head = True
-
-                dx = target_x - ex
-                dy = target_y - ey
-                dist = math.sqrt(dx*dx + dy*dy)
-                if dist != 0:
-                    dx /= dist
-                    dy /= dist
-                speed = 4
-                vx = dx * speed
-                vy = dy * speed
-
-                enemy_lasers.append([ex, ey, vx, vy, "boss"])
-                # Play the boss shooting sound
-                sounds['boss_shoots'].play()
-
-        # COLLISIONS (player vs lasers)
-        for el in enemy_lasers:
-            el_rect = None
-            if len(el) == 5 and el[4] == "boss":
-                el_rect = BOSS_LASER_IMG.get_rect(topleft=(el[0], el[1]))
-            elif len(el) == 4 and el[3] == "ship":
-                el_rect = pygame.Rect(el[0], el[1], 2*SCALE_FACTOR, 2*SCALE_FACTOR)
-
-            if el_rect and player_rect.colliderect(el_rect):
-                overlap = False
-                if len(el) == 5 and el[4] == "boss":
-                    offset_x = el_rect.x - player_rect.x
-                    offset_y = el_rect.y - player_rect.y
-                    overlap = frame_mask.overlap(BOSS_LASER_MASK, (offset_x, offset_y))
-                else:
-                    overlap = True
-                if overlap:
-                    if not invincible:
-                        lives -= 1
-                        if lives>0:
-                            sounds['player_loses_life'].play()
-                        if lives <= 0:
-                            running = False
-                            sounds['player_dies'].play()
-                            final_battle_music.stop()
-                            pygame.time.wait(2000) 
-
-                        else:
-                            invincible = True
-                            inv_timer = 0
-                    if el in enemy_lasers:
-                        enemy_lasers.remove(el)
-                    break
+            batch.add("player", a.frame[i].image, (x, y))
 
-        # Collisions (player lasers vs boss)
-        if boss_active:
-            # Decide boss facing
-            if player_x > boss_x:
-                boss_facing_right = True
-            else:
-                boss_facing_right = False
+    # The HUD counts the lives left to every boss that has come
+    bosses = (a.active[:a.count] & (a.kind[:a.count] == KIND_BOSS)).nonzero()[0]
+    boss_hp = int(np.maximum(a.hp[bosses], 0).sum())
+    batch.add("hud", HUD.update(max(int(a.hp[PLAYER]), 0), boss_hp), (0, 0))
+
+    # Draw countdown only once a boss has entered, until its fight begins
+    counting = bosses[a.phase[bosses] == BOSS_COUNTDOWN]
+    if len(counting):
+        txt_surf = TEXT_CACHE.render(font_large, countdown_text(int(a.countdown[counting[0]])), WHITE)
+        cx = (WIDTH - txt_surf.get_width())//2
+        cy = (HEIGHT - txt_surf.get_height())//2
+        batch.add("hud", txt_surf, (cx, cy))
+
+    batch.flush(world_surf)
+
+
+# -----------------------------------------------------------------------------------
+# AUDIO
+# -----------------------------------------------------------------------------------
+def play_cues(cues, walking):
+    for kind, name in cues:
+        if kind == "sound":
+            voices.play(name)
+        elif kind == "music_stop":
+            music.stop()
+        elif kind == "music_play":
+            name, loops = name
+            if not music.is_playing(name):
+                music.play(name, loops)
+        elif kind == "music_queue":
+            music.queue(name)
+
+    # Walking loop follows the state
+    voices.set_loop("walk", walking)
+
+
+# -----------------------------------------------------------------------------------
+# INPUT RECORDING
+# -----------------------------------------------------------------------------------
+# A game is fully described by its seed and the Inputs of every tick, so that is
+# all a recording holds: one bitmask byte per tick (bit i = Inputs field i),
+# zlib-compressed. "--record PATH" saves the session when the game ends,
+# "--replay PATH" plays one back instead of reading the keyboard.
+RECORDING_MAGIC = b"HYPR"
+RECORDING_VERSION = 3  # bumped whenever the same inputs would play out differently
+RECORDING_HEADER = struct.Struct("<4sBQI")  # magic, version, seed, ticks
+
+def inputs_to_mask(inputs):
+    mask = 0
+    for bit, pressed in enumerate(inputs):
+        if pressed:
+            mask |= 1 << bit
+    return mask
+
+def mask_to_inputs(mask):
+    return Inputs(*[bool(mask >> bit & 1) for bit in range(len(Inputs._fields))])
+
+class InputRecording:
+    def __init__(self, seed, masks=b""):
+        self.seed = seed
+        self.masks = bytearray(masks)
+
+    def __len__(self):
+        return len(self.masks)
+
+    def __iter__(self):
+        return (mask_to_inputs(mask) for mask in self.masks)
+
+    def append(self, inputs):
+        self.masks.append(inputs_to_mask(inputs))
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(RECORDING_HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION, self.seed, len(self.masks)))
+            f.write(zlib.compress(bytes(self.masks), 9))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < RECORDING_HEADER.size:
+            raise ValueError("%s is not a recording" % path)
+        magic, version, seed, ticks = RECORDING_HEADER.unpack_from(data)
+        if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+            raise ValueError("%s is not a version %d recording" % (path, RECORDING_VERSION))
+        try:
+            masks = zlib.decompress(data[RECORDING_HEADER.size:])
+        except zlib.error:
+            raise ValueError("%s is truncated" % path) from None
+        if len(masks) != ticks:
+            raise ValueError("%s is truncated (%d of %d ticks)" % (path, len(masks), ticks))
+        return cls(seed, masks)
+
+
+# -----------------------------------------------------------------------------------
+# HEADLESS SIMULATION
+# -----------------------------------------------------------------------------------
+def autopilot_inputs(state, rng):
+    # Walks right shooting and jumping now and then, enough to reach the boss
+    return Inputs(left=rng.random() < 0.1,
+                  right=rng.random() < 0.8,
+                  jump=rng.random() < 0.02,
+                  shoot=rng.random() < 0.1,
+                  down=rng.random() < 0.005,
+                  down_released=rng.random() < 0.05)
+
+def game_result(state):
+    return "won" if state.bosses_defeated() else "lost"
+
+def headless_stats(ticks, elapsed, games, results):
+    return {
+        "ticks": ticks,
+        "seconds": elapsed,
+        "ticks_per_second": ticks / elapsed if elapsed > 0 else float("inf"),
+        "games": games,
+        "results": results,
+    }
 
-            if boss_facing_right:
-                boss_img = BOSS_IDLE_L_FRAMES[boss_anim_index]
+def run_headless(ticks, input_source=autopilot_inputs, seed=0, recording=None):
+    # No display updates, no audio, no CLOCK.tick: runs as fast as the logic allows.
+    # A finished game (won or lost) is replaced with a new one (seeded seed + 1,
+    # seed + 2...) until ticks run out. With a recording, the inputs of the first
+    # game are appended to it and the run stops when that game ends.
+    rng = random.Random(seed)
+    state = GameState(seed)
+    if recording is not None:
+        recording.seed = seed
+    games = 1
+    results = []
+    start = time.perf_counter()
+    for tick in range(ticks):
+        inputs = input_source(state, rng)
+        state.step(inputs)
+        if recording is not None:
+            recording.append(inputs)
+        if not state.running:
+            results.append(game_result(state))
+            if recording is not None:
+                ticks = tick + 1
+                break
+            state = GameState(seed + games)
+            games += 1
+    elapsed = time.perf_counter() - start
+    return headless_stats(ticks, elapsed, games, results)
+
+def replay_headless(recording):
+    # Plays a recording back as fast as possible: the exact same workload every time
+    state = GameState(recording.seed)
+    ticks = 0
+    start = time.perf_counter()
+    for inputs in recording:
+        state.step(inputs)
+        ticks += 1
+        if not state.running:
+            break
+    elapsed = time.perf_counter() - start
+    return headless_stats(ticks, elapsed, 1, [] if state.running else [game_result(state)])
+
+
+# -----------------------------------------------------------------------------------
+# SIMULATION THREAD
+# -----------------------------------------------------------------------------------
+# With --sim-thread the game steps on a thread of its own, at TICK_RATE, while
+# the main loop reads input, plays the cues and draws. After every tick the
+# simulation publishes a StateSnapshot: copies of what draw_world needs, with
+# read-only arrays. The renderer draws the published snapshot while the next
+# one is built, and publishing is a single reference swap, so neither side ever
+# waits for the other. pygame releases the GIL while it blits, scales and flips,
+# so the two sides do overlap on separate cores.
+class TableSnapshot:
+    def __init__(self, table, columns):
+        self.count = table.count
+        for name in columns:
+            column = getattr(table, name)[:table.count].copy()
+            column.flags.writeable = False
+            setattr(self, name, column)
+
+class StateSnapshot:
+    # Reads like the GameState it was taken from, as far as draw_world goes
+    def __init__(self, state):
+        self.tick = state.tick
+        self.time = time.perf_counter()
+        self.running = state.running
+        self.walking = state.walking
+        self.camera_x = state.camera_x
+        self.prev_camera_x = state.prev_camera_x
+        self.world = state.world  # for the ground textures, which never change
+        self.actors = TableSnapshot(state.actors, ["kind", "active", "x", "y", "prev_x", "prev_y",
+                                                   "hp", "invincible", "frame", "phase", "countdown"])
+        self.ships = TableSnapshot(state.ships, ["x", "y", "vx"])
+        self.projectiles = TableSnapshot(state.projectiles, ["x", "y", "vx", "vy", "owner"])
+
+    def alpha(self):
+        # How far the clock is into the next tick, for interpolation
+        return min((time.perf_counter() - self.time) * 1000 / TICK_MS, 1.0)
+
+class SimulationThread(threading.Thread):
+    # Owns the GameState while it runs. Inputs come in through push_inputs(),
+    # cues go out through take_cues(); everything else is read from snapshot.
+    # replay_inputs and recording work as in main().
+    def __init__(self, state, replay_inputs=None, recording=None):
+        super().__init__(name="simulation", daemon=True)
+        self.state = state
+        self.replay_inputs = replay_inputs
+        self.recording = recording
+        self.snapshot = StateSnapshot(state)
+        self.cues = collections.deque()
+        self.pending_inputs = NO_INPUTS
+        self.inputs_lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def push_inputs(self, inputs):
+        with self.inputs_lock:
+            self.pending_inputs = merge_inputs(self.pending_inputs, inputs)
+
+    def take_inputs(self):
+        if self.replay_inputs is not None:
+            return next(self.replay_inputs, None)
+        with self.inputs_lock:
+            inputs = self.pending_inputs
+            self.pending_inputs = merge_inputs(NO_INPUTS, inputs)
+        return inputs
+
+    def take_cues(self):
+        cues = []
+        while self.cues:
+            cues.extend(self.cues.popleft())
+        return cues
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
+
+    def run(self):
+        state = self.state
+        next_tick = time.perf_counter()
+        while not self.stopping.is_set():
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif -delay > MAX_CATCHUP_STEPS * TICK_MS / 1000:
+                next_tick = time.perf_counter()  # after a long hitch, drop the backlog
+            next_tick += TICK_MS / 1000
+
+            inputs = self.take_inputs()
+            if inputs is None:
+                state.running = False  # the replay is over
             else:
-                boss_img = BOSS_IDLE_R_FRAMES[boss_anim_index]
-
-            boss_rect = boss_img.get_rect(topleft=(boss_x, boss_y))
-            for l in lasers:
-                if l[3] == "player":
-                    l_rect = PLAYER_LASER_IMG.get_rect(topleft=(l[0], l[1]))
-                    if l_rect.colliderect(boss_rect) and not boss_invincible:
-                        boss_hp -= 1
-                        if boss_hp>0:
-                            sounds["boss_loses_life"].play()
-                        lasers.remove(l)
-                        boss_invincible = True
-                        boss_inv_timer  = 0
-                        break
-
-            if boss_hp <= 0:
-                sounds['boss_dies'].play()
-                final_battle_music.stop()
-                running = False
-                pygame.time.wait(2000) 
+                state.step(inputs)
+                if self.recording is not None:
+                    self.recording.append(inputs)
+                self.cues.append(state.cues)
+            self.snapshot = StateSnapshot(state)
+            if not state.running:
+                break
 
-        if invincible:
-            inv_timer += 1
-            if inv_timer > INV_TIME:
-                invincible = False
 
-        if boss_invincible:
-            boss_inv_timer += 1
-            if boss_inv_timer > BOSS_INV_TIME:
-                boss_invincible = False
+# -----------------------------------------------------------------------------------
+# FRAME PROFILER
+# -----------------------------------------------------------------------------------
+# Splits every frame of main() into phases. mark(phase) books the time since the
+# previous mark to that phase, so the phases always add up to the frame (minus
+# the CLOCK.tick wait). The last HISTORY frames are kept in a ring buffer for the
+# overlay (F3, or start with --profile); --profile-csv PATH also writes every
+# frame to a CSV file. While neither is on there is no profiler at all and the
+# loop only pays for a few "if profiler" checks.
+PROFILE_PHASES = ("input", "update", "collisions", "audio", "draw", "scale", "flip")
+PROFILE_COUNTS = ("ticks", "ships", "projectiles")
+
+class FrameProfiler:
+    HISTORY = 600
+    OVERLAY_REFRESH = 30  # frames between overlay text updates
+
+    def __init__(self, csv_path=None):
+        self.phase_index = {phase: i for i, phase in enumerate(PROFILE_PHASES)}
+        self.times = np.zeros((self.HISTORY, len(PROFILE_PHASES)))
+        self.counts = np.zeros((self.HISTORY, len(PROFILE_COUNTS)), dtype=np.int64)
+        self.current = [0.0] * len(PROFILE_PHASES)
+        self.frames = 0
+        self.last = time.perf_counter()
+        self.csv_file = None
+        self.csv_writer = None
+        if csv_path:
+            self.csv_file = open(csv_path, "w", newline="")
+            self.csv_writer = csv.writer(self.csv_file)
+            self.csv_writer.writerow(("frame",) + tuple(p + "_ms" for p in PROFILE_PHASES)
+                                     + ("total_ms",) + PROFILE_COUNTS)
+        self.overlay_font = None
+        self.overlay = None
+
+    def begin_frame(self):
+        self.current = [0.0] * len(PROFILE_PHASES)
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.current[self.phase_index[phase]] += (now - self.last) * 1000
+        self.last = now
+
+    def end_frame(self, ticks, ships, projectiles):
+        row = self.frames % self.HISTORY
+        self.times[row] = self.current
+        self.counts[row] = (ticks, ships, projectiles)
+        if self.csv_writer:
+            self.csv_writer.writerow([self.frames] + ["%.4f" % ms for ms in self.current]
+                                     + ["%.4f" % sum(self.current), ticks, ships, projectiles])
+        self.frames += 1
+
+    def percentiles(self):
+        # (p50, p99) per phase plus "frame" for the whole frame, over the ring buffer
+        times = self.times[:min(self.frames, self.HISTORY)]
+        if len(times) == 0:
+            return {}
+        times = np.column_stack([times, times.sum(axis=1)])
+        p50, p99 = np.percentile(times, [50, 99], axis=0)
+        return dict(zip(PROFILE_PHASES + ("frame",), zip(p50.tolist(), p99.tolist())))
+
+    def draw_overlay(self, surface):
+        # The text is only re-rendered every OVERLAY_REFRESH frames
+        if self.overlay is None or self.frames % self.OVERLAY_REFRESH == 0:
+            self.overlay = self.render_overlay()
+        surface.blit(self.overlay, (5, HEIGHT - self.overlay.get_height() - 5))
+
+    def render_overlay(self):
+        if self.overlay_font is None:
+            self.overlay_font = pygame.font.SysFont("couriernew,dejavusansmono,monospace", 12)
+        lines = ["%-10s %6s %6s" % ("ms", "p50", "p99")]
+        for phase, (p50, p99) in self.percentiles().items():
+            lines.append("%-10s %6.2f %6.2f" % (phase, p50, p99))
+        last = self.counts[(self.frames - 1) % self.HISTORY]
+        lines.append("ticks %d  ships %d  lasers %d" % tuple(last))
+        rendered = [self.overlay_font.render(line, True, WHITE) for line in lines]
+        line_h = self.overlay_font.get_linesize()
+        overlay = pygame.Surface((max(r.get_width() for r in rendered) + 8, line_h * len(lines) + 6))
+        overlay.fill(BLACK)
+        overlay.set_alpha(180)
+        for i, r in enumerate(rendered):
+            overlay.blit(r, (4, 3 + i * line_h))
+        return overlay
+
+    def close(self):
+        if self.csv_file:
+            self.csv_file.close()
+            self.csv_file = self.csv_writer = None
+
+
+# -----------------------------------------------------------------------------------
+# INITIALIZATION
+# -----------------------------------------------------------------------------------
+def init(headless=False, present=None, level_path=None):
+    # Opens the window, shows the loading screen and loads every asset. Headless
+    # runs use SDL's dummy drivers (no window, no audio device) and skip the
+    # sounds. present picks the presentation backend (default: $HYPERS_PRESENT,
+    # else "blit" headless, where there is nothing to upscale for, and
+    # DEFAULT_PRESENT_BACKEND otherwise), level_path the level (default: level1).
+    # Only the first call does anything.
+    global RENDER, DISPLAY
+    if RENDER is not None:
+        return
+    if headless:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+    os.environ['SDL_VIDEO_CENTERED'] = '1'  # Center the Pygame window on the screen
+    pygame.init()
+    default_present = "blit" if headless else DEFAULT_PRESENT_BACKEND
+    RENDER = create_render_context(present or os.environ.get("HYPERS_PRESENT", default_present))
+    DISPLAY = RENDER.display
+    show_loading_screen()
+
+    if not headless:
+        load_sounds()
+    load_player_sprites()
+    load_ship_sprite()
+    load_boss_sprites()
+    build_frame_infos()
+    load_laser_sprites()
+    load_life_icons()
+    load_background()
+    load_level(level_path)
+
+
+# -----------------------------------------------------------------------------------
+# MAIN GAME
+# -----------------------------------------------------------------------------------
+def read_inputs(events):
+    jump = shoot = down = down_released = False
+    for event in events:
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_UP:
+                jump = True
+            elif event.key == pygame.K_SPACE:
+                shoot = True
+            elif event.key == pygame.K_DOWN:
+                down = True
+        elif event.type == pygame.KEYUP and event.key == pygame.K_DOWN:
+            down_released = True
+    keys = pygame.key.get_pressed()
+    return Inputs(left=bool(keys[pygame.K_LEFT]), right=bool(keys[pygame.K_RIGHT]),
+                  jump=jump, shoot=shoot, down=down, down_released=down_released)
+
+def main(present=None, level_path=None, record_path=None, replay_path=None,
+         profile=False, profile_csv=None, sim_thread=False):
+    # The options are those of the command line (see the end of the file)
+    init(present=present, level_path=level_path)
+    # Show the intro screen
+    show_intro_screen()
+
+    # The level's own events start its music
+    replay = InputRecording.load(replay_path) if replay_path else None
+    state = GameState(replay.seed if replay else None)
+    replay_inputs = iter(replay) if replay else None
+    recording = InputRecording(state.seed) if record_path else None
+    render = RENDER
+    font_large = pygame.font.Font(None, 64)
+    show_profile = profile
+    profiler = FrameProfiler(profile_csv) if show_profile or profile_csv else None
+    # On its own thread the simulation's phases aren't part of the frame
+    sim = SimulationThread(state, replay_inputs, recording) if sim_thread else None
+    if not sim:
+        state.profiler = profiler
+
+    # Start the game
+    accumulator = 0.0
+    pending_inputs = NO_INPUTS
+    last_tick = 0
+    if sim:
+        sim.start()
+    running = True
+    while running:
+        # CLOCK.tick only caps the frame rate; the simulation catches up in
+        # fixed TICK_MS steps, so a slow frame doesn't slow the game down
+        frame_ms = CLOCK.tick(FPS)
+        accumulator += min(frame_ms, MAX_CATCHUP_STEPS * TICK_MS)
+        if profiler:
+            profiler.begin_frame()
+
+        events = pygame.event.get()
+        for event in events:
+            music.handle_event(event)
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                # Toggle the profiler overlay; without a CSV to write, the
+                # profiler only exists while the overlay is shown
+                show_profile = not show_profile
+                if show_profile and not profiler:
+                    profiler = FrameProfiler()
+                    profiler.begin_frame()
+                elif not show_profile and not profile_csv:
+                    profiler = None
+                if not sim:
+                    state.profiler = profiler
+
+        if sim:
+            # The simulation runs by itself; hand it the keys, play what it did
+            sim.push_inputs(read_inputs(events))
+            if profiler:
+                profiler.mark("input")
+            view = sim.snapshot
+            play_cues(sim.take_cues(), view.walking)
+            if profiler:
+                profiler.mark("audio")
+            steps = view.tick - last_tick
+            last_tick = view.tick
+            alpha = view.alpha()
+            if not view.running:
+                running = False
+                pygame.time.wait(2000)
+        else:
+            pending_inputs = merge_inputs(pending_inputs, read_inputs(events))
+            if profiler:
+                profiler.mark("input")
+            steps = 0
+            while accumulator >= TICK_MS and steps < MAX_CATCHUP_STEPS:
+                # A replay ignores the keyboard and ends with its recording
+                inputs = next(replay_inputs, None) if replay else pending_inputs
+                if inputs is None:
+                    running = False
+                    break
+                state.step(inputs)
+                if recording is not None:
+                    recording.append(inputs)
+                pending_inputs = merge_inputs(NO_INPUTS, pending_inputs)
+                play_cues(state.cues, state.walking)
+                if profiler:
+                    profiler.mark("audio")
+                accumulator -= TICK_MS
+                steps += 1
+                if not state.running:
+                    running = False
+                    pygame.time.wait(2000)
+                    break
+            if steps == MAX_CATCHUP_STEPS:
+                accumulator = min(accumulator, TICK_MS)
+            view = state
+            alpha = min(accumulator / TICK_MS, 1.0)
 
         # -----------------------------------------------------------------------------------
         # DRAW
         # -----------------------------------------------------------------------------------
-        world_surf = pygame.Surface((WIDTH, HEIGHT))
-        offset_far = camera_x * 0.3
-        world_surf.blit(sky_texture_surface, (-offset_far, 0))
-
-        offset_mid = camera_x * 0.6
-        world_surf.blit(bg_layer_mid, (-offset_mid, 0))
-
-        draw_ground(world_surf, camera_x)
-
-        for s in ships:
-            sx = s["x"] - camera_x
-            sy = s["y"]
-            if -50 < sx < WIDTH + 50:
-                world_surf.blit(SHIP_IMG, (sx, sy))
-
-        for el in enemy_lasers:
-            if len(el) == 5 and el[4] == "boss":
-                rx = el[0] - camera_x
-                ry = el[1]
-                world_surf.blit(BOSS_LASER_IMG, (rx, ry))
-            elif len(el) == 4 and el[3] == "ship":
-                rx = el[0] - camera_x
-                ry = el[1]
-                color_surf = pygame.Surface((2,2), pygame.SRCALPHA)
-                pygame.draw.rect(color_surf, RED, (0,0,2,2))
-                tmp = scale_surf(color_surf, factor=2)
-                world_surf.blit(tmp, (rx, ry))
-
-        if boss_active:
-            bx = boss_x - camera_x
-            by = boss_y
-            draw_boss = True
-            if boss_invincible:
-                if (pygame.time.get_ticks() // 100) % 2 == 0:
-                    draw_boss = False
-            if -100 < bx < WIDTH + 100 and draw_boss:
-                world_surf.blit(boss_img, (bx, by))
-
-        draw_player = True
-        if invincible:
-            if (pygame.time.get_ticks() // 100) % 2 == 0:
-                draw_player = False
-        if draw_player:
-            px = player_x - camera_x
-            py = player_y
-            world_surf.blit(frame_img, (px, py))
-
-        for l in lasers:
-            if l[3] == "player":
-                lx = l[0] - camera_x
-                ly = l[1]
-                world_surf.blit(PLAYER_LASER_IMG, (lx, ly))
-
-        for i in range(lives):
-            offset_x = 5 + (LIFE_IMG.get_width() + 2)*i
-            world_surf.blit(LIFE_IMG, (offset_x, 5))
-
-        if boss_active:
-            for i in range(boss_hp):
-                x_off = 480 + (LIFE_IMG_BOSS.get_width()+2)*i
-                y_off = LIFE_IMG_BOSS.get_height() - 10
-                world_surf.blit(LIFE_IMG_BOSS, (x_off, y_off))
-
-        # Draw countdown only after boss_enter_done and not boss_fight_begun
-        if boss_active and boss_enter_done and not boss_fight_begun:
-            sec = countdown_timer // FPS
-            if   sec == 0: text = "3..."
-            elif sec == 1: text = "2..."
-            elif sec == 2: text = "1..."
-            else:          text = "FIGHT!"
-            txt_surf = font_large.render(text, True, WHITE)
-            cx = (WIDTH - txt_surf.get_width())//2
-            cy = (HEIGHT - txt_surf.get_height())//2
-            world_surf.blit(txt_surf, (cx, cy))
-
-        scaled_world = pygame.transform.scale(world_surf, (WIDTH*SCALE_FACTOR, HEIGHT*SCALE_FACTOR))
-        DISPLAY.blit(scaled_world, (0, 0))
-        pygame.display.flip()
-
-    DISPLAY.fill(BLACK)
+        draw_world(render.world, view, font_large, alpha)
+        if show_profile:
+            profiler.draw_overlay(render.world)
+        if profiler:
+            profiler.mark("draw")
+        render.scale()
+        if profiler:
+            profiler.mark("scale")
+        render.flip()
+        if profiler:
+            profiler.mark("flip")
+            profiler.end_frame(steps, view.ships.count, view.projectiles.count)
+
+    if sim:
+        sim.stop()
+    if profiler:
+        profiler.close()
+    if recording is not None:
+        recording.save(record_path)
+
+    render.world.fill(BLACK)
     font_big = pygame.font.SysFont("Arial", 16, bold=True)
-    if boss_hp <= 0:
+    if state.bosses_defeated():
         msg = "YOU WON!"
-        sounds['player_wins'].play()
+        voices.play("player_wins")
     else:
         msg = "GAME OVER"
-        sounds['game_over'].play()
+        voices.play("game_over")
     msg_surf = font_big.render(msg, True, WHITE)
-    DISPLAY.blit(msg_surf, ((WIDTH*SCALE_FACTOR)//2 - msg_surf.get_width()//2,
-                            (HEIGHT*SCALE_FACTOR)//2 - msg_surf.get_height()//2))
+    render.world.blit(msg_surf, (WIDTH//2 - msg_surf.get_width()//2,
+                                 HEIGHT//2 - msg_surf.get_height()//2))
     
     # Stop walking sound before exiting
-    if is_walking_sound_playing:
-        sounds["walk"].stop()
-        is_walking_sound_playing = False
+    voices.stop_loops()
 
-    pygame.display.flip()
+    render.present()
     pygame.time.wait(5000)
     pygame.quit()
     sys.exit()
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Hypers on Mars")
+    parser.add_argument("--present", choices=PRESENT_BACKENDS,
+                        help="presentation backend (default: $HYPERS_PRESENT or %s)" % DEFAULT_PRESENT_BACKEND)
+    parser.add_argument("--level", metavar="PATH", help="level file, JSON or compiled")
+    parser.add_argument("--record", metavar="PATH", help="save the inputs of the game")
+    parser.add_argument("--replay", metavar="PATH", help="play a recording back")
+    parser.add_argument("--profile", action="store_true", help="show the frame profiler (F3)")
+    parser.add_argument("--profile-csv", metavar="PATH", help="write every frame's timings to a CSV file")
+    parser.add_argument("--sim-thread", action="store_true", help="run the simulation on its own thread")
+    parser.add_argument("--headless", action="store_true", help="run the game logic only, as fast as possible")
+    parser.add_argument("--ticks", type=int, default=10000, help="ticks to run headless")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the headless games")
+    parser.add_argument("--compile-level", nargs=2, metavar=("JSON", "OUT"), help="write a compiled level")
+    parser.add_argument("--build-audio-cache", action="store_true", help="transcode the sounds into the audio cache")
+    args = parser.parse_args()
+
+    if args.compile_level:
+        Level.load(args.compile_level[0]).compile(args.compile_level[1])
+    elif args.build_audio_cache:
+        for cache_file in build_audio_cache():
+            print(os.path.relpath(cache_file, base_path))
+    elif args.headless:
+        init(headless=True, level_path=args.level)
+        if args.replay:
+            stats = replay_headless(InputRecording.load(args.replay))
+        elif args.record:
+            recording = InputRecording(args.seed)
+            stats = run_headless(args.ticks, seed=args.seed, recording=recording)
+            recording.save(args.record)
+        else:
+            stats = run_headless(args.ticks, seed=args.seed)
+        print("%d ticks in %.2fs (%.0f ticks/s), %d games: %s" % (
+            stats["ticks"], stats["seconds"], stats["ticks_per_second"],
+            stats["games"], ", ".join(stats["results"]) or "none finished"))
+    else:
+        main(present=args.present, level_path=args.level, record_path=args.record,
+             replay_path=args.replay, profile=args.profile, profile_csv=args.profile_csv,
+             sim_thread=args.sim_thread)